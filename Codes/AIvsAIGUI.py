@@ -5,6 +5,10 @@ import time
 import chess
 import pygame as p
 from EngineAIvsAI import get_best_move
+from Transposition import TranspositionTable
+
+# Tempo máximo por lance (segundos), None busca sempre até a profundidade
+MOVE_TIME = 5.0
 
 p.init()
 WIDTH = HEIGHT = 512
@@ -115,8 +119,8 @@ def ai_vs_ai(depth_ai1, depth_ai2):
     sequence = []
     board = chess.Board()
 
-    transposition_table_ai1 = {}
-    transposition_table_ai2 = {}
+    transposition_table_ai1 = TranspositionTable()
+    transposition_table_ai2 = TranspositionTable()
 
     # trunk-ignore(bandit/B311)
     depth_white = random.choice([depth_ai1, depth_ai2])
@@ -142,11 +146,11 @@ def ai_vs_ai(depth_ai1, depth_ai2):
 
             if board.turn == chess.WHITE:
                 best_move = get_best_move(
-                    board, depth_white, sequence, transposition_table_ai1
+                    board, depth_white, sequence, transposition_table_ai1, MOVE_TIME
                 )
             else:
                 best_move = get_best_move(
-                    board, depth_black, sequence, transposition_table_ai2
+                    board, depth_black, sequence, transposition_table_ai2, MOVE_TIME
                 )
 
             if best_move:
@@ -4,6 +4,7 @@ import time
 
 import chess
 from EngineAIvsAI import get_best_move
+from Transposition import TranspositionTable
 
 board = chess.Board()
 
@@ -123,8 +124,8 @@ def ai_vs_ai(
 
 
 def n_games(depth1, depth2, number_games=10):
-    transposition_table_ai1 = {}
-    transposition_table_ai2 = {}
+    transposition_table_ai1 = TranspositionTable()
+    transposition_table_ai2 = TranspositionTable()
 
     wins = 0
     draws = 0
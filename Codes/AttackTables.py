@@ -0,0 +1,239 @@
+import os
+from typing import List, Tuple
+
+import chess
+import numpy as np
+
+# Precomputed attack tables: knight, king and pawn attacks by square, and rook
+# and bishop attacks by square and occupancy through magic bitboards. Building
+# the slider tables means walking the rays of every relevant occupancy of every
+# square, so they are built once and saved next to this file; later runs only
+# memory-map the file and copy it into Python lists (a list read is faster than
+# reading a NumPy scalar and converting it back to an int)
+TABLE_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "AttackTables.npy"
+)
+
+# Stored as the first value of the file, bumped whenever the layout changes
+TABLE_VERSION = 1
+
+ROOK_DELTAS = (8, 1, -1, -8)
+BISHOP_DELTAS = (9, 7, -7, -9)
+KNIGHT_DELTAS = (17, 15, 10, 6, -6, -10, -15, -17)
+KING_DELTAS = (9, 8, 7, 1, -1, -7, -8, -9)
+
+# Magic numbers by square, found once by a random search of sparse candidates
+# fmt: off
+ROOK_MAGICS = [
+    0x108000108020C002, 0x4040002002441000, 0x0080100020008009, 0x4100082010000500,
+    0x8100040208010010, 0x02001810012C0200, 0x8980520001000080, 0x8100002192420100,
+    0x7A02800880284001, 0x410240065000A002, 0x4062004200208090, 0x0000804801821000,
+    0x2017001008010500, 0x0400808002004400, 0x1006004408012200, 0x08208000C0800300,
+    0x0080004000200050, 0x0004828040006001, 0x001011004100A000, 0x0208808010000800,
+    0x8001808048008400, 0x0004008044020080, 0x00002C0015102802, 0xA000020000840041,
+    0x0000400080008030, 0x8000228100400100, 0x060C200100410010, 0x0450001080800800,
+    0x2000280100110500, 0x0002860080040080, 0x21309044001A6823, 0x2C04014200040481,
+    0x0C00400829800080, 0x4100400480802000, 0x0008402001005100, 0x0106001842001020,
+    0x0007000801000430, 0x0604060080804C00, 0x0422000302002408, 0x08C0840042000291,
+    0x00400120448C8000, 0x4010102000444004, 0x001640E001030010, 0x0081001830010020,
+    0x0140080011010004, 0x0404000820040110, 0x40C2015810040002, 0x1022646084020001,
+    0x0009448200250200, 0x0004802100400100, 0x400100512000C100, 0x5048280010008680,
+    0x0030440080080080, 0x8289000400881300, 0x9384081150820400, 0x010020C400950200,
+    0x0020401080010021, 0x60B601408021001A, 0x0840081302200041, 0x1B4100100004201B,
+    0x5A0A000820105402, 0x4012000801AC1002, 0x438A609001080204, 0x00880440810400AA,
+]
+BISHOP_MAGICS = [
+    0x0022F00C00840040, 0xA4A0284081004480, 0x4029020202000205, 0x0828049100400846,
+    0x2A1C05A020000004, 0x101A021115000404, 0x20010090242204A0, 0x0100C10800A22040,
+    0x00212A0891040404, 0x0000301001012020, 0x0400420429026004, 0x0000240400808744,
+    0x0020640420008090, 0x0100020111080042, 0x5240820184044104, 0x9018006212100400,
+    0x4008004010440280, 0x0420000282024200, 0x2810040104048192, 0x0108088082004406,
+    0x0514000081A00080, 0x0000800102A00100, 0x2101440084100808, 0x5002408510482400,
+    0x2808200040061240, 0x0002100208101281, 0x210828040C080024, 0x841208008401C008,
+    0x1000848124002008, 0x02010E0205009080, 0x3004041200410400, 0x0004011014405200,
+    0x1001104044080804, 0x0000900400088840, 0x0083002482180800, 0x0044820080080280,
+    0x1040010110010140, 0x5010020200192080, 0x8110620201004101, 0x2000820204008080,
+    0x9008021004A21000, 0x4004020110500400, 0x2890084402041000, 0x0000026018000100,
+    0x0102040104000612, 0x8C04208085000200, 0x0289860802000048, 0x2590040390840430,
+    0x0A09054120200001, 0x10C2028084300248, 0x00000F00A8040022, 0x6000011942022100,
+    0x0020201022022200, 0x806084500A020200, 0x0020321001011000, 0x0109090409920000,
+    0x8200420801015022, 0x00444040C2105000, 0x0480420084208800, 0x00080020C0420600,
+    0x0040000031020200, 0x2420005450062200, 0x080130600204014A, 0x0AC0084111026101,
+]
+# fmt: on
+
+
+# Squares reached from `square` along `deltas`, stopping at the first occupied
+# square (included) when `slide`, one step only otherwise. A step that wraps
+# around the board edge moves more than two files and is dropped
+def step_attacks(square: int, occupied: int, deltas, slide: bool) -> int:
+    attacks = 0
+    for delta in deltas:
+        current = square
+        while True:
+            target = current + delta
+            if not 0 <= target < 64:
+                break
+            if abs(chess.square_file(target) - chess.square_file(current)) > 2:
+                break
+            attacks |= chess.BB_SQUARES[target]
+            if not slide or occupied & chess.BB_SQUARES[target]:
+                break
+            current = target
+    return attacks
+
+
+# Occupancy bits that can change the attacks of a slider on `square`: its empty
+# board rays without the last square of each ray, which is attacked whether it
+# is occupied or not
+def relevant_mask(square: int, deltas) -> int:
+    mask = 0
+    for delta in deltas:
+        ray = step_attacks(square, 0, (delta,), True)
+        if ray:
+            last = chess.msb(ray) if delta > 0 else chess.lsb(ray)
+            mask |= ray & ~chess.BB_SQUARES[last]
+    return mask
+
+
+# Every subset of `mask` (Carry-Rippler enumeration)
+def subsets(mask: int) -> List[int]:
+    result = []
+    subset = 0
+    while True:
+        result.append(subset)
+        subset = (subset - mask) & mask
+        if not subset:
+            return result
+
+
+# Attack table of a slider on `square` for every relevant occupancy, at the
+# index the magic number sends it to (the top bits of occupancy * magic).
+# Occupancies with different attacks must never share an index
+def slider_table(square: int, deltas, magic: int) -> Tuple[int, np.ndarray]:
+    mask = relevant_mask(square, deltas)
+    occupancies = subsets(mask)
+    attacks = np.array(
+        [step_attacks(square, occupied, deltas, True) for occupied in occupancies],
+        dtype=np.uint64,
+    )
+    shift = 64 - chess.popcount(mask)
+    indexes = (np.array(occupancies, dtype=np.uint64) * np.uint64(magic)) >> np.uint64(
+        shift
+    )
+    table = np.zeros(1 << (64 - shift), dtype=np.uint64)
+    table[indexes] = attacks
+    if not np.array_equal(table[indexes], attacks):
+        raise ValueError(f"bad magic number for square {chess.SQUARE_NAMES[square]}")
+    return mask, table
+
+
+# Whole table as one uint64 array: version, then 64 values per section for the
+# leaper attacks and the slider masks, offsets and shifts, then the rook and
+# bishop attack tables
+def build_tables() -> np.ndarray:
+    sections = [
+        [step_attacks(square, 0, KNIGHT_DELTAS, False) for square in chess.SQUARES],
+        [step_attacks(square, 0, KING_DELTAS, False) for square in chess.SQUARES],
+        [step_attacks(square, 0, (7, 9), False) for square in chess.SQUARES],
+        [step_attacks(square, 0, (-7, -9), False) for square in chess.SQUARES],
+    ]
+    slider_tables = []
+    for deltas, magics in ((ROOK_DELTAS, ROOK_MAGICS), (BISHOP_DELTAS, BISHOP_MAGICS)):
+        masks, offsets, shifts = [], [], []
+        offset = 0
+        tables = []
+        for square in chess.SQUARES:
+            mask, table = slider_table(square, deltas, magics[square])
+            masks.append(mask)
+            offsets.append(offset)
+            shifts.append(64 - chess.popcount(mask))
+            offset += len(table)
+            tables.append(table)
+        sections += [masks, offsets, shifts]
+        slider_tables.append(np.concatenate(tables))
+    header = np.array([TABLE_VERSION], dtype=np.uint64)
+    values = np.array(sections, dtype=np.uint64).ravel()
+    return np.concatenate([header, values] + slider_tables)
+
+
+# Table from the file when it exists and has the current layout, built and
+# saved otherwise. A directory that cannot be written to only costs the build
+# on every run
+def load_tables() -> np.ndarray:
+    try:
+        tables = np.load(TABLE_FILE, mmap_mode="r")
+        if len(tables) and int(tables[0]) == TABLE_VERSION:
+            return tables
+    except (OSError, ValueError):
+        pass
+    tables = build_tables()
+    try:
+        temporary = TABLE_FILE + ".tmp.npy"
+        np.save(temporary, tables)
+        os.replace(temporary, TABLE_FILE)
+    except OSError:
+        pass
+    return tables
+
+
+# The sections of the table as Python lists, in the order they are stored
+def unpack_tables(tables: np.ndarray) -> List[List[int]]:
+    values = tables[1 : 1 + 10 * 64].tolist()
+    sections = [values[64 * i : 64 * (i + 1)] for i in range(10)]
+    rook_size = sections[5][-1] + (1 << (64 - sections[6][-1]))
+    rooks_start = 1 + 10 * 64
+    sections.append(tables[rooks_start : rooks_start + rook_size].tolist())
+    sections.append(tables[rooks_start + rook_size :].tolist())
+    return sections
+
+
+(
+    KNIGHT_ATTACKS,
+    KING_ATTACKS,
+    WHITE_PAWN_ATTACKS,
+    BLACK_PAWN_ATTACKS,
+    ROOK_MASKS,
+    ROOK_OFFSETS,
+    ROOK_SHIFTS,
+    BISHOP_MASKS,
+    BISHOP_OFFSETS,
+    BISHOP_SHIFTS,
+    ROOK_ATTACKS,
+    BISHOP_ATTACKS,
+) = unpack_tables(load_tables())
+
+# Indexed by colour like chess.BB_PAWN_ATTACKS
+PAWN_ATTACKS = [BLACK_PAWN_ATTACKS, WHITE_PAWN_ATTACKS]
+
+
+def rook_attacks(square: int, occupied: int) -> int:
+    return ROOK_ATTACKS[
+        ROOK_OFFSETS[square]
+        + (
+            ((occupied & ROOK_MASKS[square]) * ROOK_MAGICS[square] & chess.BB_ALL)
+            >> ROOK_SHIFTS[square]
+        )
+    ]
+
+
+def bishop_attacks(square: int, occupied: int) -> int:
+    return BISHOP_ATTACKS[
+        BISHOP_OFFSETS[square]
+        + (
+            ((occupied & BISHOP_MASKS[square]) * BISHOP_MAGICS[square] & chess.BB_ALL)
+            >> BISHOP_SHIFTS[square]
+        )
+    ]
+
+
+# Pieces of both colours attacking `square` with the given occupancy
+def attackers_to(board: chess.BaseBoard, square: int, occupied: int) -> int:
+    return (
+        (KNIGHT_ATTACKS[square] & board.knights)
+        | (KING_ATTACKS[square] & board.kings)
+        | (WHITE_PAWN_ATTACKS[square] & board.pawns & board.occupied_co[chess.BLACK])
+        | (BLACK_PAWN_ATTACKS[square] & board.pawns & board.occupied_co[chess.WHITE])
+        | (rook_attacks(square, occupied) & (board.rooks | board.queens))
+        | (bishop_attacks(square, occupied) & (board.bishops | board.queens))
+    ) & occupied
@@ -0,0 +1,116 @@
+from typing import List, Tuple
+
+import chess
+
+
+# Squares from which a piece of each type would attack `king`, indexed by piece
+# type (index 0 unused), for pieces of `color` with the current occupancy
+def check_squares(board: chess.Board, color: chess.Color, king: int) -> List[int]:
+    occupied = board.occupied
+    diagonal = chess.BB_DIAG_ATTACKS[king][chess.BB_DIAG_MASKS[king] & occupied]
+    straight = (
+        chess.BB_RANK_ATTACKS[king][chess.BB_RANK_MASKS[king] & occupied]
+        | chess.BB_FILE_ATTACKS[king][chess.BB_FILE_MASKS[king] & occupied]
+    )
+    return [
+        0,
+        chess.BB_PAWN_ATTACKS[not color][king],
+        chess.BB_KNIGHT_ATTACKS[king],
+        diagonal,
+        straight,
+        diagonal | straight,
+        0,
+    ]
+
+
+# Pieces of either colour that are the only piece between a slider of `color`
+# and `king`
+def line_blockers(board: chess.Board, color: chess.Color, king: int) -> int:
+    queens = board.queens & board.occupied_co[color]
+    snipers = (
+        chess.BB_DIAG_ATTACKS[king][0]
+        & (board.bishops & board.occupied_co[color] | queens)
+    ) | (
+        (chess.BB_RANK_ATTACKS[king][0] | chess.BB_FILE_ATTACKS[king][0])
+        & (board.rooks & board.occupied_co[color] | queens)
+    )
+    blockers = 0
+    for sniper in chess.scan_reversed(snipers):
+        between = chess.between(king, sniper) & board.occupied
+        if between and chess.popcount(between) == 1:
+            blockers |= between
+    return blockers
+
+
+# Pieces of `color` between one of its sliders and the enemy `king`: moving them
+# off that line gives a discovered check
+def discovered_checkers(board: chess.Board, color: chess.Color, king: int) -> int:
+    return line_blockers(board, color, king) & board.occupied_co[color]
+
+
+# Pieces of `color` pinned to their own `king`
+def pinned_pieces(board: chess.Board, color: chess.Color, king: int) -> int:
+    return line_blockers(board, not color, king) & board.occupied_co[color]
+
+
+# Everything needed to test the moves of the side to move for check, computed
+# once per node: (enemy king square, check squares, discovered checkers)
+def check_info(board: chess.Board) -> Tuple[int, List[int], int]:
+    king = board.king(not board.turn)
+    if king is None:
+        return -1, [0] * 7, 0
+    return (
+        king,
+        check_squares(board, board.turn, king),
+        discovered_checkers(board, board.turn, king),
+    )
+
+
+# Whether a non-capturing move gives check, from the masks of check_info.
+# Promotions and castling move a piece off a line the masks may depend on, so
+# they are left to board.gives_check
+def is_check_move(
+    board: chess.Board, move: chess.Move, info: Tuple[int, List[int], int]
+) -> bool:
+    king, targets, discoverers = info
+    if king < 0:
+        return False
+    if move.promotion or board.is_castling(move):
+        return board.gives_check(move)
+    piece_type = board.piece_type_at(move.from_square)
+    if targets[piece_type] & chess.BB_SQUARES[move.to_square]:
+        return True
+    return bool(
+        discoverers & chess.BB_SQUARES[move.from_square]
+        and not chess.BB_RAYS[king][move.from_square] & chess.BB_SQUARES[move.to_square]
+    )
+
+
+# Whether a pseudo-legal move of the side to move leaves its own king safe, given
+# our king square and pinned pieces. Only valid when not in check; en passant
+# and castling are left to board.is_legal
+def is_safe_move(board: chess.Board, move: chess.Move, king: int, pinned: int) -> bool:
+    if board.is_en_passant(move) or board.is_castling(move):
+        return board.is_legal(move)
+    if move.from_square == king:
+        occupied = board.occupied ^ chess.BB_SQUARES[king]
+        return not board.attackers_mask(not board.turn, move.to_square, occupied)
+    if pinned & chess.BB_SQUARES[move.from_square]:
+        return bool(
+            chess.BB_RAYS[king][move.from_square] & chess.BB_SQUARES[move.to_square]
+        )
+    return True
+
+
+# Every square attacked by a piece of `color`: pawns by shifting the whole pawn
+# bitboard, the other pieces one attack mask each
+def attacked_squares(board: chess.Board, color: chess.Color) -> int:
+    pieces = board.occupied_co[color]
+    pawns = board.pawns & pieces
+    if color == chess.WHITE:
+        attacks = chess.shift_up_left(pawns) | chess.shift_up_right(pawns)
+    else:
+        attacks = chess.shift_down_left(pawns) | chess.shift_down_right(pawns)
+    for square in chess.scan_reversed(pieces & ~board.pawns):
+        attacks |= board.attacks_mask(square)
+    return attacks
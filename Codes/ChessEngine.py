@@ -1,12 +1,43 @@
 import random
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import chess
-from chess.polyglot import zobrist_hash
+from Attacks import attacked_squares
+from EvalCache import EvalCache
+from MoveCache import MoveCache
+from MoveOrdering import MoveHeuristics, staged_moves, winning_captures
 from Openings import openings
-from Tables import manhattan_center_distance_king, piece_tables
+from PawnStructure import pawn_structure_score
+from SearchBoard import SearchBoard
+from StaticExchange import capture_gain
+from Tables import late_move_reductions, manhattan_center_distance_king
+from TimeControl import SearchTimeout, TimeControl
+from Transposition import (
+    EXACT,
+    LOWER,
+    MATE_THRESHOLD,
+    UPPER,
+    TranspositionTable,
+    decode_move,
+)
 
 MATE_SCORE = 100000.0
+# Largura da janela nula usada para testar os lances depois do primeiro
+NULL_WINDOW = 0.01
+# Profundidade a partir da qual a raiz usa janela de aspiração
+ASPIRATION_MIN_DEPTH = 3
+# Profundidade mínima para tentar o null move
+NULL_MOVE_MIN_DEPTH = 3
+# Lances tranquilos a partir deste índice podem ser reduzidos (LMR), e até esta
+# profundidade podem ser podados (LMP)
+LATE_MOVE_INDEX = 3
+LMP_MAX_DEPTH = 3
+# Limites da quiescência: capturas que não chegam a DELTA_MARGIN (em peões) de alfa
+# são ignoradas, nenhuma linha passa de QS_MAX_PLY lances, e depois de QS_NODE_BUDGET
+# nós de quiescência numa busca o resto só devolve a avaliação estática
+DELTA_MARGIN = 2.0
+QS_MAX_PLY = 8
+QS_NODE_BUDGET = 200000
 
 PIECE_VALUES = {
     chess.PAWN: 1,
@@ -18,11 +49,43 @@ PIECE_VALUES = {
 
 
 class ChessEngine:
-    def __init__(self, board: chess.Board, depth: int, color: chess.Color):
+    def __init__(
+        self,
+        board: chess.Board,
+        depth: int,
+        color: chess.Color,
+        movetime: Optional[float] = None,
+        hash_mb: float = 16,
+        aspiration_window: float = 0.5,
+        aspiration_growth: float = 2.0,
+        eval_cache_mb: float = 4,
+        pawn_hash_mb: float = 1,
+        move_cache_entries: int = 1 << 15,
+    ):
         self.board = board
-        self.depth = depth
+        self.depth = depth  # profundidade máxima do iterative deepening
         self.color = color
-        self.tt: Dict[int, float] = {}
+        self.tt = TranspositionTable(hash_mb)
+        self.eval_cache = EvalCache(eval_cache_mb)
+        # Estrutura de peões pela chave Zobrist só dos peões
+        self.pawn_table = EvalCache(pawn_hash_mb)
+        # Listas de lances já geradas, pela chave Zobrist
+        self.move_cache = MoveCache(move_cache_entries)
+        self.heuristics = MoveHeuristics()
+        self.time_control = TimeControl(movetime)
+        self.root_ply = 0
+        self.completed_depth = 0
+        self.aspiration_window = aspiration_window
+        self.aspiration_growth = aspiration_growth
+        # Quantas vezes a janela de aspiração falhou em cada lado na última busca,
+        # quantos nós a quiescência usou e os acertos e falhas do cache de lances
+        self.stats: Dict[str, int] = {
+            "fail_low": 0,
+            "fail_high": 0,
+            "qs_nodes": 0,
+            "move_cache_hits": 0,
+            "move_cache_misses": 0,
+        }
 
     def select_random_opening(self, ope: Dict[str, List[str]]) -> Optional[Tuple[str, List[str]]]:
         if not ope:
@@ -42,12 +105,6 @@ class ChessEngine:
         else:
             return op
 
-    def piece_value(self, piece: Optional[chess.Piece]) -> float:
-        if not piece or piece.piece_type == chess.KING:
-            return 0.0
-        v = PIECE_VALUES[piece.piece_type]
-        return v if piece.color == chess.WHITE else -v
-
     def mopup_eval(self) -> float:
         eval = 0
 
@@ -61,130 +118,316 @@ class ChessEngine:
         distance_between_kings = chess.square_manhattan_distance(my_king_square, opp_king_square)
 
         eval += 14 - distance_between_kings
-        
-        for sq in chess.SQUARES:
-            piece = self.board.piece_at(sq)
-            if piece and piece.piece_type != chess.KING:
-                if self.board.attackers_mask(not self.color, sq) > 0 and self.board.attackers_mask(self.color, sq) == 0:
-                    eval -= self.piece_value(piece) if piece.color == chess.WHITE else -self.piece_value(piece)
+
+        # Peças (de qualquer cor) atacadas pelo adversário e não defendidas por nós
+        board = self.board
+        hanging = (
+            board.occupied
+            & ~board.kings
+            & attacked_squares(board, not self.color)
+            & ~attacked_squares(board, self.color)
+        )
+        if hanging:
+            for piece_type, value in PIECE_VALUES.items():
+                pieces = board.pieces_mask(piece_type, chess.WHITE) | board.pieces_mask(
+                    piece_type, chess.BLACK
+                )
+                eval -= value * chess.popcount(hanging & pieces)
 
         return 10 * eval
 
+    # Contagem das peças direto dos bitboards, sem percorrer as 64 casas
     def is_endgame(self) -> bool:
-        queens = 0
-        minor_pieces = 0
-        
-        for sq in chess.SQUARES:
-            piece = self.board.piece_at(sq)
-            if piece:
-                if piece.piece_type == chess.QUEEN:
-                    queens += 1
-                if piece.piece_type == chess.KNIGHT or piece.piece_type == chess.BISHOP:
-                    minor_pieces += 1
-        
+        queens = chess.popcount(self.board.queens)
+        minor_pieces = chess.popcount(self.board.knights | self.board.bishops)
+
         if queens == 0 and minor_pieces < 3:
             return True
         if queens == 1 and minor_pieces < 2:
             return True
         return False
-    
-    def evaluate_positional(self) -> float:
-        score = 0.0
-        table = None
-        for square in chess.SQUARES:
-            piece = self.board.piece_at(square)
-            if piece:
-                if self.is_endgame() and piece.piece_type == chess.KING:
-                    table = piece_tables["K_end"]
-                elif self.is_endgame() and piece.piece_type == chess.PAWN:
-                    table = piece_tables["P_end"]
-                else:
-                    table = piece_tables.get(piece.piece_type)
-
-                if table:
-                    idx = square if piece.color == chess.WHITE else chess.square_mirror(square)
-                    score += table[idx] if piece.color == chess.WHITE else -table[idx]
-        return score
-    
-    def evaluate_board(self) -> float:
-        eval = 0
-        material = sum(self.piece_value(p) for p in self.board.piece_map().values())
-        eval += material
-        positional = self.evaluate_positional()
-        eval += positional
-        if self.is_endgame():
-            return self.mopup_eval() + eval
-        return eval
 
-    def move_score(self, move: chess.Move) -> float:
-        score = 0
-        piece_to_move = self.board.piece_at(move.from_square)
-        piece_to_capture = self.board.piece_at(move.to_square)
+    # Final só de peões (e rei) para quem joga: o null move não é confiável por causa do zugzwang
+    def is_pawn_endgame(self) -> bool:
+        board = self.board
+        pieces = board.occupied_co[board.turn] & ~(board.pawns | board.kings)
+        return pieces == 0
 
-        if piece_to_capture is not None:
-            score = 10 * self.piece_value(piece_to_move) - self.piece_value(piece_to_capture)
-
-        if move.promotion is not None:
-            score += PIECE_VALUES[move.promotion]
-
-        if self.board.attackers_mask(not self.color, move.to_square) > 0:
-            score -= self.piece_value(piece_to_move)
+    # Lance tranquilo: não captura, não promove e não dá xeque
+    def is_quiet(self, move: chess.Move) -> bool:
+        return (
+            move.promotion is None
+            and not self.board.is_capture(move)
+            and not self.board.gives_check(move)
+        )
 
+    def can_null_move(self, depth: int, beta: float) -> bool:
+        if depth < NULL_MOVE_MIN_DEPTH or self.board.is_check():
+            return False
+        # Nunca dois null moves seguidos
+        if self.board.move_stack and not self.board.move_stack[-1]:
+            return False
+        if self.is_pawn_endgame():
+            return False
+        return self.evaluate_relative() >= beta
+    
+    # Material e tabelas de posição vêm somados de forma incremental pelo SearchBoard,
+    # interpolados entre as tabelas de meio-jogo e de final pela fase do jogo;
+    # a estrutura de peões vem da tabela de peões
+    def evaluate_board(self) -> float:
+        score = self.board.tapered_score()
+        score += pawn_structure_score(self.board, self.pawn_table)
+        if self.is_endgame():
+            return self.mopup_eval() + score
         return score
 
-    def move_ordering(self, moves: List[chess.Move]) -> List[chess.Move]:
-        return sorted(moves, key=self.move_score, reverse=True)
+    # Lances em estágios (veja MoveOrdering.staged_moves): lance da tabela, capturas
+    # e promoções pelo SEE, killers, lances tranquilos pelo histórico e por fim as
+    # capturas perdedoras. Os lances tranquilos só são gerados se os estágios
+    # anteriores não deram corte, e as listas ficam no cache de lances. Os lances
+    # são inteiros compactados (Transposition.encode_move), 0 é nenhum lance
+    def ordered_moves(self, hash_move: int, ply: int = 0) -> Iterator[int]:
+        return staged_moves(
+            self.board, hash_move, self.heuristics, ply, self.move_cache
+        )
 
-    def quiescence(self, alpha: float, beta: float) -> float:
-        eval = self.evaluate_board()
-        if eval >= beta:
+    # Só capturas, na ordem do SEE; as que perdem material são descartadas.
+    # qs_ply conta os lances desde o fim da busca principal
+    def quiescence(self, alpha: float, beta: float, qs_ply: int = 0) -> float:
+        self.time_control.check()
+        self.stats["qs_nodes"] += 1
+        stand_pat = self.evaluate_relative()
+        if stand_pat >= beta:
             return beta
-        alpha = max(alpha, eval)
-
-        moves = list(self.board.legal_moves)
-        capture_moves = list(filter(self.board.is_capture, moves))
-        capture_moves = self.move_ordering(capture_moves)
+        alpha = max(alpha, stand_pat)
+        if qs_ply >= QS_MAX_PLY or self.stats["qs_nodes"] >= QS_NODE_BUDGET:
+            return alpha
 
-        for capture in capture_moves:
+        for capture in winning_captures(self.board, self.move_cache):
+            # Delta pruning: nem ganhando a peça de graça o valor chegaria a alfa
+            if stand_pat + capture_gain(self.board, capture) + DELTA_MARGIN < alpha:
+                continue
             self.board.push(capture)
-            eval = -self.quiescence(-beta, -alpha)
+            eval = -self.quiescence(-beta, -alpha, qs_ply + 1)
             self.board.pop()
             if eval >= beta:
                 return beta
             alpha = max(alpha, eval)
         return alpha
 
+    # Avaliação do ponto de vista de quem joga (necessário para o negamax).
+    # A avaliação de cada posição fica guardada no cache pela chave Zobrist
+    def evaluate_relative(self) -> float:
+        key = self.board.key
+        score = self.eval_cache.probe(key)
+        if score is None:
+            score = self.evaluate_board()
+            self.eval_cache.store(key, score)
+        return score if self.board.turn == chess.WHITE else -score
+
     def minimax(self, depth: int, alpha: float, beta: float) -> float:
-        
-        board_hash = zobrist_hash(self.board)
-        if board_hash in self.tt:
-            return self.tt[board_hash]
-        
-        moves = list(self.board.legal_moves)
-        if len(moves) == 0:
-            start_depth = self.depth
-            if self.board.is_check():
-                # Cheque-Mate
-                return start_depth - depth - MATE_SCORE
-            else:
-                # Empate
-                return start_depth - depth
+        self.time_control.check()
+        ply = len(self.board.move_stack) - self.root_ply
+        # Repetição, regra dos 50 lances ou material insuficiente
+        if self.board.is_search_draw():
+            return 0.0
+
+        board_hash = self.board.key
+        tt_score, tt_move = self.tt.probe(board_hash, depth, alpha, beta, ply)
+        if tt_score is not None:
+            return tt_score
 
         if depth == 0:
-            score = self.evaluate_board()
-            self.tt[board_hash] = score
+            # Basta achar um lance legal para saber que a posição não é terminal
+            if not any(self.board.generate_legal_moves()):
+                # Cheque-Mate ou afogamento
+                return ply - MATE_SCORE if self.board.is_check() else 0.0
+            # As folhas seguem só com capturas até a posição ficar calma; o
+            # resultado é um limite quando sai da janela
+            score = self.quiescence(alpha, beta)
+            if score <= alpha:
+                flag = UPPER
+            elif score >= beta:
+                flag = LOWER
+            else:
+                flag = EXACT
+            self.tt.store(board_hash, 0, score, flag, 0, ply)
             return score
 
-        moves = self.move_ordering(moves)
-        for move in moves:
+        # Null move: se mesmo passando a vez a busca reduzida passa de beta,
+        # a posição já está ganha o suficiente para cortar
+        if self.can_null_move(depth, beta):
+            reduction = 3 if depth >= 6 else 2
+            self.board.push(chess.Move.null())
+            null_score = -self.minimax(
+                depth - 1 - reduction, -beta, -beta + NULL_WINDOW
+            )
+            self.board.pop()
+            if null_score >= beta:
+                self.tt.store(board_hash, depth, beta, LOWER, tt_move, ply)
+                return beta
+
+        # PVS: o primeiro lance usa a janela completa, os outros uma janela nula,
+        # e só são refeitos com a janela completa se passarem de alpha. O lance só
+        # é convertido para chess.Move para ser jogado e consultado no tabuleiro
+        in_check = self.board.is_check()
+        best_move = 0
+        searched_quiets: List[int] = []
+        i = -1
+        for i, packed in enumerate(self.ordered_moves(tt_move, ply)):
+            move = decode_move(packed)
+            reduction = 0
+            if (
+                i >= LATE_MOVE_INDEX
+                and not in_check
+                and self.is_quiet(move)
+                and not self.heuristics.is_killer(packed, ply)
+            ):
+                # Late move pruning: perto das folhas os últimos lances tranquilos
+                # quase nunca são os melhores
+                if (
+                    depth <= LMP_MAX_DEPTH
+                    and i >= 3 + depth * depth
+                    and alpha > -MATE_THRESHOLD
+                ):
+                    continue
+                reduction = late_move_reductions[min(depth, 63)][min(i, 63)]
+                reduction = min(reduction, depth - 1)
+
             self.board.push(move)
-            eval_score = -self.minimax(depth - 1, -beta, -alpha)
+            if i == 0:
+                eval_score = -self.minimax(depth - 1, -beta, -alpha)
+            else:
+                eval_score = -self.minimax(
+                    depth - 1 - reduction, -alpha - NULL_WINDOW, -alpha
+                )
+                # Lance reduzido que passou de alpha é refeito na profundidade cheia
+                if reduction and eval_score > alpha:
+                    eval_score = -self.minimax(depth - 1, -alpha - NULL_WINDOW, -alpha)
+                if alpha < eval_score < beta:
+                    eval_score = -self.minimax(depth - 1, -beta, -alpha)
             self.board.pop()
+            quiet = move.promotion is None and not self.board.is_capture(move)
             if eval_score >= beta:
+                if quiet:
+                    self.heuristics.update(
+                        self.board, packed, depth, ply, searched_quiets
+                    )
+                self.tt.store(board_hash, depth, beta, LOWER, packed, ply)
                 return beta
-            alpha = max(alpha, eval_score)
+            if quiet:
+                searched_quiets.append(packed)
+            if eval_score > alpha:
+                alpha = eval_score
+                best_move = packed
+        # Nenhum lance legal: cheque-mate ou afogamento
+        if i < 0:
+            return ply - MATE_SCORE if in_check else 0.0
+        flag = EXACT if best_move else UPPER
+        self.tt.store(board_hash, depth, alpha, flag, best_move, ply)
         return alpha
 
+    def search_root(
+        self,
+        depth: int,
+        pv_move: int,
+        alpha: float = -MATE_SCORE,
+        beta: float = MATE_SCORE,
+    ) -> Tuple[int, float]:
+        moves = list(self.ordered_moves(0))
+        # O melhor lance da iteração anterior é buscado primeiro
+        if pv_move in moves:
+            moves.remove(pv_move)
+            moves.insert(0, pv_move)
+
+        best_move = 0
+        best_score = -MATE_SCORE
+        for i, move in enumerate(moves):
+            self.board.push(decode_move(move))
+            if i == 0:
+                score = -self.minimax(depth - 1, -beta, -alpha)
+            else:
+                score = -self.minimax(depth - 1, -alpha - NULL_WINDOW, -alpha)
+                if score > alpha:
+                    score = -self.minimax(depth - 1, -beta, -alpha)
+            self.board.pop()
+            if not best_move or score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+        return best_move, best_score
+
+    # Janela de aspiração: começa estreita em volta da pontuação da iteração
+    # anterior e é alargada do lado que falhou até a pontuação caber nela
+    def aspiration_search(
+        self, depth: int, pv_move: int, prev_score: float
+    ) -> Tuple[int, float]:
+        if depth < ASPIRATION_MIN_DEPTH or abs(prev_score) >= MATE_THRESHOLD:
+            return self.search_root(depth, pv_move)
+
+        delta = self.aspiration_window
+        alpha, beta = prev_score - delta, prev_score + delta
+        while True:
+            move, score = self.search_root(depth, pv_move, alpha, beta)
+            if score <= alpha:
+                self.stats["fail_low"] += 1
+                alpha = max(score - delta, -MATE_SCORE)
+            elif score >= beta:
+                self.stats["fail_high"] += 1
+                beta = min(score + delta, MATE_SCORE)
+                pv_move = move
+            else:
+                return move, score
+            delta *= self.aspiration_growth
+
+    def iterative_deepening(self) -> Tuple[Optional[chess.Move], float]:
+        # A busca usa uma cópia que mantém a chave Zobrist de forma incremental;
+        # o tabuleiro do jogo volta no final, mesmo se a iteração for interrompida
+        game_board = self.board
+        self.board = SearchBoard.from_board(game_board)
+        try:
+            return self.search_iterations()
+        finally:
+            self.board = game_board
+
+    # Só o lance devolvido no final volta a ser um chess.Move
+    def search_iterations(self) -> Tuple[Optional[chess.Move], float]:
+        self.time_control.start()
+        self.tt.new_search()
+        self.eval_cache.new_search()
+        self.move_cache.new_search()
+        self.heuristics.new_search()
+        self.root_ply = len(self.board.move_stack)
+        self.completed_depth = 0
+        self.stats = dict.fromkeys(self.stats, 0)
+        best_move = 0
+        best_score = 0.0
+
+        for depth in range(1, self.depth + 1):
+            try:
+                move, score = self.aspiration_search(depth, best_move, best_score)
+            except SearchTimeout:
+                break
+            best_move, best_score = move, score
+            self.completed_depth = depth
+            self.stats["move_cache_hits"] = self.move_cache.hits
+            self.stats["move_cache_misses"] = self.move_cache.misses
+            print(
+                f"depth {depth} score {best_score:.2f} time {self.time_control.elapsed():.2f}s"
+                f" fail low {self.stats['fail_low']} fail high {self.stats['fail_high']}"
+                f" eval cache {self.eval_cache.hit_rate():.0f}%"
+                f" move cache {self.move_cache.hit_rate():.0f}%"
+            )
+            # Mate encontrado, buscar mais fundo não muda o lance
+            if abs(best_score) >= MATE_SCORE - depth:
+                break
+            if not self.time_control.can_start_iteration():
+                break
+        return decode_move(best_move), best_score
+
     def get_best_move(self, sequence: List[str]) -> chess.Move:
         # Tenta abrir com abertura se houver sequência ou posição inicial
         print('trying openings')
@@ -196,26 +439,7 @@ class ChessEngine:
                 print("Opening selected")
                 return chess.Move.from_uci(self.board.parse_san(san=san_move).uci())
         print('going into search')
-        best_move: Optional[chess.Move] = None
-        # Se engine joga White, queremos maximizar; se joga Black, queremos minimizar
-        if self.color == chess.WHITE:
-            best_score = -MATE_SCORE
-        else:
-            best_score = MATE_SCORE
-
-        moves = list(self.board.legal_moves)
-        for move in moves:
-            self.board.push(move)
-            score = self.minimax(self.depth - 1, -MATE_SCORE, MATE_SCORE)
-            self.board.pop()
-            if self.color == chess.WHITE:
-                if score >= best_score:
-                    best_score = score
-                    best_move = move
-            else:
-                if score <= best_score:
-                    best_score = score
-                    best_move = move
+        best_move, _ = self.iterative_deepening()
         if best_move:
             return best_move
-        return random.choice(moves)
+        return random.choice(list(self.board.legal_moves))
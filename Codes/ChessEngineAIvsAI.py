@@ -1,12 +1,23 @@
 import random
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import chess
 from chess.polyglot import zobrist_hash
 from Openings import openings
-from Tables import manhattan_distance_king, piece_tables
+from Tables import manhattan_center_distance_king as manhattan_distance_king
+from Tables import piece_tables
+from Transposition import (
+    EXACT,
+    LOWER,
+    UPPER,
+    TranspositionTable,
+    decode_move,
+    encode_move,
+)
 
 MATE_SCORE = 100000.0
+# Largura da janela nula usada para testar os lances depois do primeiro
+NULL_WINDOW = 0.01
 
 
 class ChessEngine:
@@ -15,7 +26,7 @@ class ChessEngine:
         board: chess.Board,
         depth: int,
         color: bool,
-        transposition_table: Dict[int, float],
+        transposition_table: TranspositionTable,
     ):
         self.board = board
         self.depth = depth
@@ -143,8 +154,25 @@ class ChessEngine:
 
         return guess
 
+    # Lance da tabela primeiro, os outros só são gerados e ordenados se ele não der corte
+    def ordered_moves(self, hash_move: Optional[chess.Move]) -> Iterator[chess.Move]:
+        if hash_move is not None and self.board.is_legal(hash_move):
+            yield hash_move
+        else:
+            hash_move = None
+        yield from sorted(
+            (m for m in self.board.legal_moves if m != hash_move),
+            key=lambda m: self.move_priority(m),
+            reverse=self.board.turn != chess.BLACK,
+        )
+
+    # Avaliação do ponto de vista de quem joga (necessário para o negamax)
+    def evaluate_relative(self) -> float:
+        score = self.evaluate_board()
+        return score if self.board.turn == chess.WHITE else -score
+
     def quiescence(self, alpha: float, beta: float) -> float:
-        stand_pat = self.evaluate_board()
+        stand_pat = self.evaluate_relative()
         if stand_pat >= beta:
             return beta
         if alpha < stand_pat:
@@ -166,66 +194,75 @@ class ChessEngine:
                 alpha = score
         return alpha
 
-    def minimax_alpha_beta(
+    # Guarda o resultado com o tipo de limite dado pela janela usada na busca
+    def store_search_result(
         self,
+        board_hash: int,
         depth: int,
+        score: float,
         alpha: float,
         beta: float,
-        is_maximizing: bool,
-    ) -> float:
-        ai_depth = self.depth
+        best_move: Optional[chess.Move],
+        ply: int,
+    ) -> None:
+        if score <= alpha:
+            flag = UPPER
+        elif score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.transposition_table.store(
+            board_hash, depth, score, flag, encode_move(best_move), ply
+        )
+
+    # Principal Variation Search (negamax): o primeiro lance usa a janela
+    # completa, os outros uma janela nula, e só são refeitos se passarem de alpha
+    def minimax_alpha_beta(self, depth: int, alpha: float, beta: float) -> float:
+        ply = self.depth - depth
         if self.board.is_game_over():
             if self.board.is_checkmate():
-                return (
-                    MATE_SCORE - (ai_depth - depth)
-                    if self.board.turn == chess.BLACK
-                    else (ai_depth - depth) - MATE_SCORE
-                )
+                return ply - MATE_SCORE
             else:
-                return (
-                    (ai_depth - depth)
-                    if self.board.turn == chess.WHITE
-                    else -(ai_depth - depth)
-                )
+                return 0.0
 
         board_hash = zobrist_hash(self.board)
-        if board_hash in self.transposition_table:
-            return self.transposition_table[board_hash]
+        alpha_orig = alpha
+        tt_score, tt_move = self.transposition_table.probe(
+            board_hash, depth, alpha, beta, ply
+        )
+        if tt_score is not None:
+            return tt_score
 
-        if depth == 0 or self.board.is_game_over():
-            score = self.evaluate_board()
-            self.transposition_table[board_hash] = score
+        if depth == 0:
+            score = self.evaluate_relative()
+            self.transposition_table.store(board_hash, 0, score, EXACT, 0, ply)
             return score
 
-        moves = sorted(
-            self.board.legal_moves,
-            key=lambda m: self.move_priority(m),
-            reverse=self.board.turn != chess.BLACK,
-        )
-        if is_maximizing:
-            max_eval = -MATE_SCORE
-            for move in moves:
-                self.board.push(move)
-                eval_score = self.minimax_alpha_beta(depth - 1, alpha, beta, False)
-                self.board.pop()
-                max_eval = max(max_eval, eval_score)
-                alpha = max(alpha, eval_score)
-                if beta <= alpha:
-                    break
-            self.transposition_table[board_hash] = max_eval
-            return max_eval
-        else:
-            min_eval = MATE_SCORE
-            for move in moves:
-                self.board.push(move)
-                eval_score = self.minimax_alpha_beta(depth - 1, alpha, beta, True)
-                self.board.pop()
-                min_eval = min(min_eval, eval_score)
-                beta = min(beta, eval_score)
-                if beta <= alpha:
+        best_score = -MATE_SCORE
+        best_move = None
+        # A tabela guarda o lance compactado (Transposition.encode_move)
+        for i, move in enumerate(self.ordered_moves(decode_move(tt_move))):
+            self.board.push(move)
+            if i == 0:
+                eval_score = -self.minimax_alpha_beta(depth - 1, -beta, -alpha)
+            else:
+                eval_score = -self.minimax_alpha_beta(
+                    depth - 1, -alpha - NULL_WINDOW, -alpha
+                )
+                if alpha < eval_score < beta:
+                    eval_score = -self.minimax_alpha_beta(depth - 1, -beta, -alpha)
+            self.board.pop()
+            if best_move is None or eval_score > best_score:
+                best_score = eval_score
+                best_move = move
+            if eval_score > alpha:
+                alpha = eval_score
+                if alpha >= beta:
                     break
-            self.transposition_table[board_hash] = min_eval
-            return min_eval
+        self.store_search_result(
+            board_hash, depth, best_score, alpha_orig, beta, best_move, ply
+        )
+        return best_score
 
     def get_best_move(self, sequence: List[str]) -> Optional[chess.Move]:
         # Tenta abrir com abertura se houver sequência ou posição inicial
@@ -247,29 +284,29 @@ class ChessEngine:
                     "Book",
                 )
 
-        # Busca minimax
-        best_move: Optional[chess.Move] = None
-        # Se engine joga White, queremos maximizar; se joga Black, queremos minimizar
-        best_score = -MATE_SCORE if self.color == chess.WHITE else MATE_SCORE
-
+        # Busca PVS na raiz, com a pontuação do ponto de vista de quem joga
+        self.transposition_table.new_search()
         moves = sorted(
             self.board.legal_moves,
             key=lambda m: self.move_priority(m),
             reverse=self.board.turn != chess.BLACK,
         )
-        for move in moves:
+        best_move: Optional[chess.Move] = None
+        alpha, beta = -MATE_SCORE, MATE_SCORE
+        for i, move in enumerate(moves):
             self.board.push(move)
-            # is_maximizing começa True porque é a vez da engine ao aplicar este método
-            score = self.minimax_alpha_beta(
-                self.depth - 1, -MATE_SCORE, MATE_SCORE, False
-            )
-            self.board.pop()
-            if self.color == chess.WHITE:
-                if score >= best_score:
-                    best_score = score
-                    best_move = move
+            if i == 0:
+                score = -self.minimax_alpha_beta(self.depth - 1, -beta, -alpha)
             else:
-                if score <= best_score:
-                    best_score = score
-                    best_move = move
+                score = -self.minimax_alpha_beta(
+                    self.depth - 1, -alpha - NULL_WINDOW, -alpha
+                )
+                if score > alpha:
+                    score = -self.minimax_alpha_beta(self.depth - 1, -beta, -alpha)
+            self.board.pop()
+            if best_move is None or score > alpha:
+                alpha = score
+                best_move = move
+        # Quem chama espera a pontuação do ponto de vista das brancas
+        best_score = alpha if self.board.turn == chess.WHITE else -alpha
         return best_move, best_score
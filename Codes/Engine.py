@@ -4,9 +4,22 @@ from typing import Dict, List, Optional, Tuple
 import chess
 from chess.polyglot import zobrist_hash
 from Openings import openings
+from StaticExchange import capture_gain
 from Tables import piece_tables
+from Transposition import EXACT, LOWER, UPPER, TranspositionTable, encode_move
 
-transposition_table: Dict[int, float] = {}
+# Quiescence limits: captures that cannot bring the score within DELTA_MARGIN
+# (in pawns) of alpha are skipped, no line goes deeper than QS_MAX_PLY, and once
+# a search has spent QS_NODE_BUDGET quiescence nodes the rest only stand pat
+DELTA_MARGIN = 2.0
+QS_MAX_PLY = 8
+QS_NODE_BUDGET = 2000
+# Width of the null window used to test the moves after the first one
+NULL_WINDOW = 0.01
+
+transposition_table = TranspositionTable()
+# Quiescence nodes of the running search, reset by get_best_move
+qs_nodes = 0
 
 
 # Select a random opening
@@ -67,7 +80,12 @@ def evaluate_board(board: chess.Board) -> float:
             or board.is_seventyfive_moves()
         ):
             return 0
+    return static_score(board)
+
 
+# Material plus piece-square score, without the game-over checks. Quiescence
+# uses it as the stand pat: it only runs on positions that have legal moves
+def static_score(board: chess.Board) -> float:
     material_score = sum(piece_value(board, square) for square in chess.SQUARES)
     positional_score = evaluate_positional(board)
     return material_score + positional_score
@@ -82,13 +100,14 @@ def get_table_index(square: int, color: bool) -> int:
 # Function that evaluates the position of pieces based on piece-square tables
 def evaluate_positional(board: chess.Board) -> float:
     score = 0
+    endgame = is_endgame(board)
     for square in chess.SQUARES:
         piece = board.piece_at(square)
         if not piece:
             continue
-        if is_endgame(board) and piece.piece_type == chess.KING:
+        if endgame and piece.piece_type == chess.KING:
             table = piece_tables["K_end"]
-        elif is_endgame(board) and piece.piece_type == chess.PAWN:
+        elif endgame and piece.piece_type == chess.PAWN:
             table = piece_tables["P_end"]
         else:
             table = piece_tables.get(piece.symbol().upper())
@@ -137,17 +156,30 @@ def move_priority(board: chess.Board, move: chess.Move) -> float:
     return guess
 
 
-# Quiescence search with more tactical depth
-def quiescence(alpha: float, beta: float, board: chess.Board) -> float:
-    stand_pat = evaluate_board(board)
+# Quiescence search with more tactical depth, qs_ply counts the plies since the
+# main search ended. Scores are from the side to move
+def quiescence(alpha: float, beta: float, board: chess.Board, qs_ply: int = 0) -> float:
+    global qs_nodes
+    qs_nodes += 1
+    stand_pat = static_score(board)
+    if board.turn == chess.BLACK:
+        stand_pat = -stand_pat
 
     if stand_pat >= beta:
         return beta
     if alpha < stand_pat:
         alpha = stand_pat
-
-    # Only consider capture moves
-    capture_moves = [m for m in board.legal_moves if board.is_capture(m)]
+    if qs_ply >= QS_MAX_PLY or qs_nodes >= QS_NODE_BUDGET:
+        return alpha
+
+    # Only consider capture moves, skipping the ones that could not reach alpha
+    # even if the captured piece came for free (delta pruning)
+    capture_moves = [
+        m
+        for m in board.legal_moves
+        if board.is_capture(m)
+        and stand_pat + capture_gain(board, m) + DELTA_MARGIN >= alpha
+    ]
     moves = sorted(
         capture_moves,
         key=lambda m: move_priority(board, m),
@@ -155,7 +187,7 @@ def quiescence(alpha: float, beta: float, board: chess.Board) -> float:
     )
     for move in moves:
         board.push(move)
-        score = -quiescence(-beta, -alpha, board)
+        score = -quiescence(-beta, -alpha, board, qs_ply + 1)
         board.pop()
         if score >= beta:
             return beta
@@ -164,30 +196,58 @@ def quiescence(alpha: float, beta: float, board: chess.Board) -> float:
     return alpha
 
 
-# Função principal de busca Minimax com poda alfa-beta
+# Save a node result with the bound type given by the window it was searched with
+def store_search_result(
+    board_hash: int,
+    depth: int,
+    score: float,
+    alpha: float,
+    beta: float,
+    best_move: Optional[chess.Move],
+) -> None:
+    if score <= alpha:
+        flag = UPPER
+    elif score >= beta:
+        flag = LOWER
+    else:
+        flag = EXACT
+    transposition_table.store(board_hash, depth, score, flag, encode_move(best_move))
+
+
+# Principal Variation Search (negamax): scores are from the side to move.
+# The first move gets the full window, the others a null window, and they are
+# only searched again with the full window when they fail high
 def minimax_alpha_beta(
     depth: int,
     alpha: float,
     beta: float,
-    is_maximizing: bool,
     board: chess.Board,
     max_depth: int,
 ) -> float:
     board_hash = zobrist_hash(board)
 
-    if board_hash in transposition_table:
-        return transposition_table[board_hash]
+    alpha_orig = alpha
+
+    tt_score, _ = transposition_table.probe(board_hash, depth, alpha, beta)
+    if tt_score is not None:
+        return tt_score
 
-    if depth == 0 or board.is_game_over():
+    if board.is_game_over():
         score = evaluate_board(board)
-        if board.is_game_over():
-            score += (
-                -(depth - max_depth) * 10
-                if board.turn == chess.BLACK
-                else (depth - max_depth) * 10
-            )
-        # score = quiescence(-999999, 999999, board)
-        transposition_table[board_hash] = score
+        score += (
+            -(depth - max_depth) * 10
+            if board.turn == chess.BLACK
+            else (depth - max_depth) * 10
+        )
+        if board.turn == chess.BLACK:
+            score = -score
+        transposition_table.store(board_hash, depth, score, EXACT, 0)
+        return score
+
+    # The leaves go on with captures only until the position is quiet
+    if depth == 0:
+        score = quiescence(alpha, beta, board)
+        store_search_result(board_hash, 0, score, alpha_orig, beta, None)
         return score
 
     moves = sorted(
@@ -195,30 +255,28 @@ def minimax_alpha_beta(
         key=lambda m: move_priority(board, m),
         reverse=board.turn != chess.BLACK,
     )
-    if is_maximizing:
-        max_eval = -999999
-        for move in moves:
-            board.push(move)
-            eval = minimax_alpha_beta(depth - 1, alpha, beta, False, board, max_depth)
-            board.pop()
-            max_eval = max(max_eval, eval)
-            alpha = max(alpha, eval)
-            if beta <= alpha:
-                break
-        transposition_table[board_hash] = max_eval
-        return max_eval
-    else:
-        min_eval = 999999
-        for move in moves:
-            board.push(move)
-            eval = minimax_alpha_beta(depth - 1, alpha, beta, True, board, max_depth)
-            board.pop()
-            min_eval = min(min_eval, eval)
-            beta = min(beta, eval)
-            if beta <= alpha:
+    best_score = -999999
+    best_move = None
+    for i, move in enumerate(moves):
+        board.push(move)
+        if i == 0:
+            score = -minimax_alpha_beta(depth - 1, -beta, -alpha, board, max_depth)
+        else:
+            score = -minimax_alpha_beta(
+                depth - 1, -alpha - NULL_WINDOW, -alpha, board, max_depth
+            )
+            if alpha < score < beta:
+                score = -minimax_alpha_beta(depth - 1, -beta, -alpha, board, max_depth)
+        board.pop()
+        if best_move is None or score > best_score:
+            best_score = score
+            best_move = move
+        if score > alpha:
+            alpha = score
+            if alpha >= beta:
                 break
-        transposition_table[board_hash] = min_eval
-        return min_eval
+    store_search_result(board_hash, depth, best_score, alpha_orig, beta, best_move)
+    return best_score
 
 
 # Get the best move for the AI
@@ -240,20 +298,28 @@ def get_best_move(
             move = opening[1][len(sequence)]
             return chess.Move.from_uci(board.parse_san(san=move).uci())
 
+    global qs_nodes
+    qs_nodes = 0
+    # PVS at the root too, scores from the side to move
     best_move = None
-    best_score = -999999 if board.turn == chess.WHITE else 999999
+    alpha, beta = -999999, 999999
     moves = sorted(
         board.legal_moves,
         key=lambda m: move_priority(board, m),
         reverse=board.turn != chess.BLACK,
     )
-    for move in moves:
+    for i, move in enumerate(moves):
         board.push(move)
-        score = minimax_alpha_beta(
-            depth - 1, -999999, 999999, board.turn == chess.WHITE, board, depth
-        )
+        if i == 0:
+            score = -minimax_alpha_beta(depth - 1, -beta, -alpha, board, depth)
+        else:
+            score = -minimax_alpha_beta(
+                depth - 1, -alpha - NULL_WINDOW, -alpha, board, depth
+            )
+            if score > alpha:
+                score = -minimax_alpha_beta(depth - 1, -beta, -alpha, board, depth)
         board.pop()
-        if score >= best_score if board.turn == chess.WHITE else score <= best_score:
-            best_score = score
+        if best_move is None or score > alpha:
+            alpha = score
             best_move = move
     return best_move
@@ -1,12 +1,83 @@
 import random
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import chess
-from chess.polyglot import zobrist_hash
+from Attacks import check_info, is_check_move
+from EvalCache import EvalCache
+from MoveCache import MoveCache
+from MoveOrdering import MoveHeuristics, staged_moves, winning_captures
 from Openings import openings
-from Tables import piece_tables
+from PawnStructure import pawn_structure_score
+from SearchBoard import SearchBoard
+from StaticExchange import capture_gain
+from Tables import late_move_reductions
+from TimeControl import SearchTimeout, TimeControl
+from Transposition import (
+    EXACT,
+    LOWER,
+    MATE_THRESHOLD,
+    UPPER,
+    TranspositionTable,
+    decode_move,
+)
 
 MATE_SCORE = 100000
+# Width of the zero window used to test moves after the first one
+NULL_WINDOW = 0.01
+# Aspiration window at the root: initial half-width (in pawns), how much it grows
+# after each failed search, and the first depth that uses it
+ASPIRATION_WINDOW = 0.5
+ASPIRATION_GROWTH = 2.0
+ASPIRATION_MIN_DEPTH = 3
+# Shallowest depth where null move pruning is tried
+NULL_MOVE_MIN_DEPTH = 3
+# Quiet moves from this index on may be reduced (LMR), and pruned (LMP) up to
+# LMP_MAX_DEPTH
+LATE_MOVE_INDEX = 3
+LMP_MAX_DEPTH = 3
+# Quiescence limits: captures that cannot bring the score within DELTA_MARGIN
+# (in pawns) of alpha are skipped, no line goes deeper than QS_MAX_PLY, and once
+# a search has spent QS_NODE_BUDGET quiescence nodes the rest only stand pat
+DELTA_MARGIN = 2.0
+QS_MAX_PLY = 8
+QS_NODE_BUDGET = 200000
+# Quiet checks are only searched in the first QS_CHECK_PLIES plies of quiescence
+QS_CHECK_PLIES = 2
+
+# Default memory budget of the evaluation cache and of the pawn hash table, in MB
+EVAL_CACHE_MB = 4
+PAWN_HASH_MB = 1
+# Positions whose move lists are kept by the move cache
+MOVE_CACHE_ENTRIES = 1 << 15
+# Pieces counted in the endgame weights
+NON_PAWN_PIECES = (chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN)
+
+# Clock of the running search, replaced on every get_best_move call
+time_control = TimeControl()
+# Length of the move stack at the root, used to count plies inside the search
+root_ply = 0
+# Killer and history tables, kept between searches
+heuristics = MoveHeuristics()
+# Static evaluations by position, kept between searches; see set_eval_cache_size
+eval_cache = EvalCache(EVAL_CACHE_MB)
+# Pawn structure scores by pawn-only Zobrist key
+pawn_table = EvalCache(PAWN_HASH_MB)
+# Move lists by position, kept between searches
+move_cache = MoveCache(MOVE_CACHE_ENTRIES)
+# Counters of the last search, reset by iterative_deepening
+search_stats: Dict[str, int] = {
+    "fail_low": 0,
+    "fail_high": 0,
+    "qs_nodes": 0,
+    "move_cache_hits": 0,
+    "move_cache_misses": 0,
+}
+
+
+# Replace the evaluation cache with an empty one of `size_mb` megabytes
+def set_eval_cache_size(size_mb: float) -> None:
+    global eval_cache
+    eval_cache = EvalCache(size_mb)
 
 
 # Select a random opening
@@ -34,25 +105,39 @@ def filter_openings(
         return op
 
 
-# Determine if the game is in the endgame
+# Determine if the game is in the endgame, counting pieces on the bitboards
 def is_endgame(board: chess.Board) -> bool:
-    piece_map = board.piece_map()
-    minor_pieces = sum(
-        1 for p in piece_map.values() if p.piece_type in {chess.BISHOP, chess.KNIGHT}
-    )
-    major_pieces = sum(
-        1 for p in piece_map.values() if p.piece_type in {chess.ROOK, chess.QUEEN}
-    )
+    minor_pieces = chess.popcount(board.bishops | board.knights)
+    major_pieces = chess.popcount(board.rooks | board.queens)
     return major_pieces <= 1 or (major_pieces == 2 and minor_pieces < 3)
 
 
-# Avaliação do valor de uma peça com base na posição no tabuleiro
-def piece_value(board: chess.Board, square: chess.Square) -> float:
-    piece = board.piece_at(square)
-    if not piece or piece.symbol().upper() == "K":
-        return 0
-    value = {"P": 1, "N": 3, "B": 3.2, "R": 5, "Q": 9}[piece.symbol().upper()]
-    return value if piece.color == chess.WHITE else -value
+# The side to move has only pawns and king left: null move is unsafe there
+# because zugzwang is common
+def is_pawn_endgame(board: chess.Board) -> bool:
+    pieces = board.occupied_co[board.turn] & ~(board.pawns | board.kings)
+    return pieces == 0
+
+
+# Quiet move: not a capture, a promotion or a check
+def is_quiet(board: chess.Board, move: chess.Move) -> bool:
+    return (
+        move.promotion is None
+        and not board.is_capture(move)
+        and not board.gives_check(move)
+    )
+
+
+# Null move pruning is skipped in check, in pawn endgames, right after another
+# null move and when the static eval is already below beta
+def can_null_move(board: chess.Board, depth: int, beta: float) -> bool:
+    if depth < NULL_MOVE_MIN_DEPTH or board.is_check():
+        return False
+    if board.move_stack and not board.move_stack[-1]:
+        return False
+    if is_pawn_endgame(board):
+        return False
+    return evaluate_relative(board) >= beta
 
 
 def endgame_eval(
@@ -84,7 +169,7 @@ def endgame_eval(
     return eval_score * endgame_weight if is_white else -eval_score * endgame_weight
 
 
-def evaluate_board(board: chess.Board) -> float:
+def evaluate_board(board: SearchBoard) -> float:
     # Piece values
     values = {
         chess.PAWN: 1,
@@ -95,166 +180,106 @@ def evaluate_board(board: chess.Board) -> float:
     }
     evaluation = 0.0
 
-    # Game over checks
-    if board.is_game_over():
-        if board.is_checkmate():
-            return -MATE_SCORE if board.turn else MATE_SCORE
-        else:
-            return 0.0
-
-    # Material and positional evaluation
-    white_material = 0.0
-    black_material = 0.0
-    for square in chess.SQUARES:
-        piece = board.piece_at(square)
-        if not piece or piece.piece_type == chess.KING:
-            continue
-        value = values.get(piece.piece_type, 0)
-        if piece.color == chess.WHITE:
-            white_material += value
-        else:
-            black_material += value
-
-    # Remove pawns for endgame weighting
-    white_no_pawns = white_material - sum(
-        values[chess.PAWN]
-        for sq in chess.SQUARES
-        if (p := board.piece_at(sq))
-        and p.color == chess.WHITE
-        and p.piece_type == chess.PAWN
-    )
-    black_no_pawns = black_material - sum(
-        values[chess.PAWN]
-        for sq in chess.SQUARES
-        if (p := board.piece_at(sq))
-        and p.color == chess.BLACK
-        and p.piece_type == chess.PAWN
-    )
-
-    # Endgame weight calculation
-    endgame_material_start = (
-        values[chess.ROOK] * 2 + values[chess.BISHOP] + values[chess.KNIGHT]
-    )
-
-    def endgame_weight(material_no_pawns: float) -> float:
-        return (
-            1 - min(1, material_no_pawns / endgame_material_start)
-            if endgame_material_start > 0
-            else 1
-        )
-
-    endgame_weight_white = endgame_weight(white_no_pawns)
-    endgame_weight_black = endgame_weight(black_no_pawns)
-
-    # Material and positional score
-    material_score = white_material - black_material
-    positional_score = evaluate_positional(board)
-    evaluation += material_score + positional_score
+    # Material and piece-square tables, summed incrementally by the search board
+    # and interpolated between the middlegame and endgame sets by the game phase
+    evaluation += board.tapered_score()
+    # Passed, isolated, doubled and backward pawns, from the pawn hash table
+    evaluation += pawn_structure_score(board, pawn_table)
 
     # Endgame evaluation if appropriate
     if is_endgame(board):
         wk = board.king(chess.WHITE)
         bk = board.king(chess.BLACK)
         if wk is not None and bk is not None:
-            evaluation += endgame_eval(wk, bk, endgame_weight_white, True)
-            evaluation += endgame_eval(bk, wk, endgame_weight_black, False)
-
-    return evaluation
-
-
-# Function to get the correct index for piece-square tables based on color
-def get_table_index(square: int, color: bool) -> int:
-    # For white, flip the square vertically to match the table orientation
-    return square if color == chess.WHITE else chess.square_mirror(square)
-
-
-# Função que avalia a posição das peças com base nas tabelas
-def evaluate_positional(board: chess.Board) -> float:
-    score = 0
-    for square in chess.SQUARES:
-        piece = board.piece_at(square)
-        if not piece:
-            continue
-        if is_endgame(board) and piece.piece_type == chess.KING:
-            table = piece_tables["K_end"]
-        elif is_endgame(board) and piece.piece_type == chess.PAWN:
-            table = piece_tables["P_end"]
-        else:
-            table = piece_tables.get(piece.symbol().upper())
-
-        if table:
-            table_index = get_table_index(square, piece.color)
-            if piece.color == chess.WHITE:
-                score += table[table_index]
-            else:
-                score -= table[table_index]
-    return score
-
-
-def piece_value_type(piece: Optional[chess.Piece]) -> float:
-    if not piece or piece == chess.KING:
-        return 0
-    value = {
-        chess.PAWN: 1,
-        chess.KNIGHT: 3,
-        chess.BISHOP: 3.2,
-        chess.ROOK: 5,
-        chess.QUEEN: 9,
-    }
-    return (
-        value.get(piece.piece_type, 0)
-        if piece.color == chess.WHITE
-        else -value.get(piece.piece_type, 0)
-    )
+            # Material without pawns of each side, counted on the bitboards
+            white_no_pawns = sum(
+                values[piece_type]
+                * chess.popcount(board.pieces_mask(piece_type, chess.WHITE))
+                for piece_type in NON_PAWN_PIECES
+            )
+            black_no_pawns = sum(
+                values[piece_type]
+                * chess.popcount(board.pieces_mask(piece_type, chess.BLACK))
+                for piece_type in NON_PAWN_PIECES
+            )
 
+            # Endgame weight calculation
+            endgame_material_start = (
+                values[chess.ROOK] * 2 + values[chess.BISHOP] + values[chess.KNIGHT]
+            )
 
-# Refined move priority function
-def move_priority(board: chess.Board, move: chess.Move) -> float:
-    guess = 0
-    values = {
-        chess.PAWN: 1,
-        chess.KNIGHT: 2.8,
-        chess.BISHOP: 3,
-        chess.ROOK: 5,
-        chess.QUEEN: 9,
-        chess.KING: 0,
-    }
-    attacker = board.piece_at(move.from_square)
-    victim = board.piece_at(move.to_square)
+            def endgame_weight(material_no_pawns: float) -> float:
+                return (
+                    1 - min(1, material_no_pawns / endgame_material_start)
+                    if endgame_material_start > 0
+                    else 1
+                )
 
-    if board.is_capture(move):
-        guess = 0.1 * (piece_value_type(victim) - piece_value_type(attacker))
-    if bool(move.promotion):
-        promo_value = values.get(move.promotion, 0)
-        guess += promo_value if board.turn == chess.WHITE else -promo_value
-    if board.is_attacked_by(not board.turn, move.to_square):
-        guess -= piece_value_type(attacker)
-    if board.gives_check(move):
-        guess += 10
+            endgame_weight_white = endgame_weight(white_no_pawns)
+            endgame_weight_black = endgame_weight(black_no_pawns)
+            evaluation += endgame_eval(wk, bk, endgame_weight_white, True)
+            evaluation += endgame_eval(bk, wk, endgame_weight_black, False)
 
-    return guess
+    return evaluation
 
 
-# Quiescence search with more tactical depth
-def quiescence(alpha: float, beta: float, board: chess.Board) -> float:
-    stand_pat = evaluate_board(board)
+# Evaluation from the point of view of the side to move, as negamax needs.
+# Evaluations are cached by Zobrist key
+def evaluate_relative(board: SearchBoard) -> float:
+    score = eval_cache.probe(board.key)
+    if score is None:
+        score = evaluate_board(board)
+        eval_cache.store(board.key, score)
+    return score if board.turn == chess.WHITE else -score
+
+
+# Moves in stages (see MoveOrdering.staged_moves): hash move, captures and
+# promotions by static exchange, killers, quiet moves by history and last the
+# losing captures. The quiet moves are only generated if the previous stages did
+# not produce a cutoff, and the lists are kept in the move cache. Moves are
+# packed integers (Transposition.encode_move), 0 meaning no move
+def ordered_moves(board: chess.Board, hash_move: int, ply: int = 0) -> Iterator[int]:
+    return staged_moves(board, hash_move, heuristics, ply, move_cache)
+
+
+# Quiescence search with more tactical depth, qs_ply counts the plies since the
+# main search ended
+def quiescence(alpha: float, beta: float, board: chess.Board, qs_ply: int = 0) -> float:
+    time_control.check()
+    search_stats["qs_nodes"] += 1
+    # Mates can only happen after the checks searched here; a position that is
+    # not in check is never scored as a stalemate
+    if board.is_check() and not any(board.generate_legal_moves()):
+        return len(board.move_stack) - root_ply - MATE_SCORE
+    stand_pat = evaluate_relative(board)
 
     if stand_pat >= beta:
         return beta
     if alpha < stand_pat:
         alpha = stand_pat
-    # Only consider capture moves and checks
-    capture_moves = [
-        m for m in board.legal_moves if board.is_capture(m) or board.gives_check(m)
+    if qs_ply >= QS_MAX_PLY or search_stats["qs_nodes"] >= QS_NODE_BUDGET:
+        return alpha
+    # Only consider captures that do not lose material (by static exchange) and,
+    # near the start of quiescence, quiet checks. Captures are searched best
+    # exchange first, then the checks. Delta pruning: captures that would not
+    # reach alpha even winning the piece for free are skipped
+    moves = [
+        move
+        for move in winning_captures(board, move_cache)
+        if stand_pat + capture_gain(board, move) + DELTA_MARGIN >= alpha
     ]
-    moves = sorted(
-        capture_moves,
-        key=lambda m: move_priority(board, m),
-        reverse=board.turn != chess.BLACK,
-    )
+    if qs_ply < QS_CHECK_PLIES:
+        info = check_info(board)
+        moves.extend(
+            move
+            for move in board.generate_legal_moves(
+                to_mask=chess.BB_ALL & ~board.occupied
+            )
+            if not board.is_en_passant(move) and is_check_move(board, move, info)
+        )
     for move in moves:
         board.push(move)
-        score = -quiescence(-beta, -alpha, board)
+        score = -quiescence(-beta, -alpha, board, qs_ply + 1)
         board.pop()
         if score >= beta:
             return beta
@@ -263,67 +288,156 @@ def quiescence(alpha: float, beta: float, board: chess.Board) -> float:
     return alpha
 
 
-# Função principal de busca Minimax com poda alfa-beta
+# Save a node result with the bound type given by the window it was searched with
+def store_search_result(
+    transposition_table: TranspositionTable,
+    board_hash: int,
+    depth: int,
+    score: float,
+    alpha: float,
+    beta: float,
+    best_move: int,
+    ply: int,
+) -> None:
+    if score <= alpha:
+        flag = UPPER
+    elif score >= beta:
+        flag = LOWER
+    else:
+        flag = EXACT
+    transposition_table.store(board_hash, depth, score, flag, best_move, ply)
+
+
+# Principal Variation Search (negamax): scores are from the side to move.
+# The first move gets the full window, the others a null window, and they are
+# only searched again with the full window when they fail high
 def minimax_alpha_beta(
     depth: int,
     alpha: float,
     beta: float,
-    is_maximizing: bool,
-    board: chess.Board,
-    transposition_table: Dict[int, float],
-    max_depth: int,
+    board: SearchBoard,
+    transposition_table: TranspositionTable,
 ) -> float:
-    board_hash = zobrist_hash(board)
-    transpos_table = transposition_table
-
-    if board_hash in transposition_table:
-        return transposition_table[board_hash]
-
-    if depth == 0 or board.is_game_over():
-        # score = evaluate_board(board)
-        score = quiescence(-MATE_SCORE, MATE_SCORE, board)
-        if board.is_game_over():
-            score += (
-                -(depth - max_depth) * 10
-                if board.turn == chess.BLACK
-                else (depth - max_depth) * 10
-            )
-        transposition_table[board_hash] = score
+    time_control.check()
+    ply = len(board.move_stack) - root_ply
+    if board.is_search_draw():
+        return 0.0
+    board_hash = board.key
+    alpha_orig = alpha
+
+    tt_score, tt_move = transposition_table.probe(board_hash, depth, alpha, beta, ply)
+    if tt_score is not None:
+        return tt_score
+
+    if depth == 0:
+        # One legal move is enough to know the position is not terminal
+        if not any(board.generate_legal_moves()):
+            # Shorter mates score higher
+            return ply - MATE_SCORE if board.is_check() else 0.0
+        score = quiescence(alpha, beta, board)
+        store_search_result(
+            transposition_table, board_hash, 0, score, alpha, beta, 0, ply
+        )
         return score
 
-    moves = sorted(
-        board.legal_moves,
-        key=lambda m: move_priority(board, m),
-        reverse=board.turn == chess.BLACK,
-    )
-    if is_maximizing:
-        max_eval = -MATE_SCORE
-        for move in moves:
-            board.push(move)
-            eval = minimax_alpha_beta(
-                depth - 1, alpha, beta, False, board, transpos_table, max_depth
+    # Null move: if passing the turn still fails high with a reduced search,
+    # the position is good enough to cut off
+    if can_null_move(board, depth, beta):
+        reduction = 3 if depth >= 6 else 2
+        board.push(chess.Move.null())
+        null_score = -minimax_alpha_beta(
+            depth - 1 - reduction,
+            -beta,
+            -beta + NULL_WINDOW,
+            board,
+            transposition_table,
+        )
+        board.pop()
+        if null_score >= beta:
+            # Do not trust mate scores found after passing
+            if null_score >= MATE_THRESHOLD:
+                null_score = beta
+            transposition_table.store(
+                board_hash, depth, null_score, LOWER, tt_move, ply
             )
-            board.pop()
-            max_eval = max(max_eval, eval)
-            alpha = max(alpha, eval)
-            if beta <= alpha:
-                break
-        transposition_table[board_hash] = max_eval
-        return max_eval
-    else:
-        min_eval = MATE_SCORE
-        for move in moves:
-            board.push(move)
-            eval = minimax_alpha_beta(
-                depth - 1, alpha, beta, True, board, transpos_table, max_depth
+            return null_score
+
+    # Moves stay packed; each one is decoded once to be played and looked up on
+    # the board
+    in_check = board.is_check()
+    best_score = -MATE_SCORE
+    best_move = 0
+    searched_quiets: List[int] = []
+    i = -1
+    for i, packed in enumerate(ordered_moves(board, tt_move, ply)):
+        move = decode_move(packed)
+        reduction = 0
+        if (
+            i >= LATE_MOVE_INDEX
+            and not in_check
+            and is_quiet(board, move)
+            and not heuristics.is_killer(packed, ply)
+        ):
+            # Late move pruning: near the leaves the last quiet moves are
+            # almost never the best ones
+            if (
+                depth <= LMP_MAX_DEPTH
+                and i >= 3 + depth * depth
+                and best_score > -MATE_THRESHOLD
+            ):
+                continue
+            reduction = late_move_reductions[min(depth, 63)][min(i, 63)]
+            reduction = min(reduction, depth - 1)
+
+        board.push(move)
+        if i == 0:
+            score = -minimax_alpha_beta(
+                depth - 1, -beta, -alpha, board, transposition_table
             )
-            board.pop()
-            min_eval = min(min_eval, eval)
-            beta = min(beta, eval)
-            if beta <= alpha:
+        else:
+            score = -minimax_alpha_beta(
+                depth - 1 - reduction,
+                -alpha - NULL_WINDOW,
+                -alpha,
+                board,
+                transposition_table,
+            )
+            # A reduced move that beats alpha is searched again at full depth
+            if reduction and score > alpha:
+                score = -minimax_alpha_beta(
+                    depth - 1, -alpha - NULL_WINDOW, -alpha, board, transposition_table
+                )
+            if alpha < score < beta:
+                score = -minimax_alpha_beta(
+                    depth - 1, -beta, -alpha, board, transposition_table
+                )
+        board.pop()
+        quiet = move.promotion is None and not board.is_capture(move)
+        if not best_move or score > best_score:
+            best_score = score
+            best_move = packed
+        if score > alpha:
+            alpha = score
+            if alpha >= beta:
+                if quiet:
+                    heuristics.update(board, packed, depth, ply, searched_quiets)
                 break
-        transposition_table[board_hash] = min_eval
-        return min_eval
+        if quiet:
+            searched_quiets.append(packed)
+    # No legal moves: checkmate or stalemate
+    if i < 0:
+        return ply - MATE_SCORE if in_check else 0.0
+    store_search_result(
+        transposition_table,
+        board_hash,
+        depth,
+        best_score,
+        alpha_orig,
+        beta,
+        best_move,
+        ply,
+    )
+    return best_score
 
 
 openings_names: List[str] = []
@@ -335,7 +449,8 @@ def get_best_move(
     board: chess.Board,
     depth: int,
     sequence: List[str],
-    transpositon_table: Dict[int, float],
+    transpositon_table: TranspositionTable,
+    movetime: Optional[float] = None,
 ) -> Optional[chess.Move]:
     if sequence or board.fen() == chess.STARTING_FEN:
         filtered_openings = filter_openings(openings, sequence)
@@ -365,28 +480,120 @@ def get_best_move(
             else:
                 print("No move found in opening book.")
 
-    moves = sorted(
-        board.legal_moves,
-        key=lambda m: move_priority(board, m),
-        reverse=board.turn == chess.BLACK,
-    )
-    best_move: Optional[chess.Move] = moves[0]
-    best_score = -MATE_SCORE if board.turn == chess.WHITE else MATE_SCORE
-    for move in moves:
-        board.push(move)
-        score = minimax_alpha_beta(
-            depth - 1,
-            -MATE_SCORE,
-            MATE_SCORE,
-            board.turn == chess.WHITE,
-            board,
-            transpositon_table,
-            depth,
-        )
+    return iterative_deepening(board, depth, transpositon_table, movetime)
+
+
+# Search every root move at a fixed depth, trying the previous best move first.
+# The score is from the side to move
+def search_root(
+    board: chess.Board,
+    depth: int,
+    transposition_table: TranspositionTable,
+    pv_move: int,
+    alpha: float = -MATE_SCORE,
+    beta: float = MATE_SCORE,
+) -> Tuple[int, float]:
+    moves = list(ordered_moves(board, 0))
+    if pv_move in moves:
+        moves.remove(pv_move)
+        moves.insert(0, pv_move)
+    best_move = moves[0]
+    best_score = -MATE_SCORE
+    for i, move in enumerate(moves):
+        board.push(decode_move(move))
+        if i == 0:
+            score = -minimax_alpha_beta(
+                depth - 1, -beta, -alpha, board, transposition_table
+            )
+        else:
+            score = -minimax_alpha_beta(
+                depth - 1, -alpha - NULL_WINDOW, -alpha, board, transposition_table
+            )
+            if score > alpha:
+                score = -minimax_alpha_beta(
+                    depth - 1, -beta, -alpha, board, transposition_table
+                )
         board.pop()
-        if score >= best_score if board.turn == chess.WHITE else score <= best_score:
+        if i == 0 or score > best_score:
             best_score = score
             best_move = move
-    if len(moves) == 1:
-        best_move = moves[0]
+        if score > alpha:
+            alpha = score
+            if alpha >= beta:
+                break
     return best_move, best_score
+
+
+# Aspiration windows: start with a narrow window around the previous iteration's
+# score and widen the side that failed until the score fits inside it
+def aspiration_search(
+    board: chess.Board,
+    depth: int,
+    transposition_table: TranspositionTable,
+    pv_move: int,
+    prev_score: float,
+) -> Tuple[int, float]:
+    if depth < ASPIRATION_MIN_DEPTH or abs(prev_score) >= MATE_THRESHOLD:
+        return search_root(board, depth, transposition_table, pv_move)
+
+    delta = ASPIRATION_WINDOW
+    alpha, beta = prev_score - delta, prev_score + delta
+    while True:
+        move, score = search_root(
+            board, depth, transposition_table, pv_move, alpha, beta
+        )
+        if score <= alpha:
+            search_stats["fail_low"] += 1
+            alpha = max(score - delta, -MATE_SCORE)
+        elif score >= beta:
+            search_stats["fail_high"] += 1
+            beta = min(score + delta, MATE_SCORE)
+            pv_move = move
+        else:
+            return move, score
+        delta *= ASPIRATION_GROWTH
+
+
+# Iterative deepening: search depth 1, 2, 3... until max_depth or the time runs
+# out. The search works on packed moves, only the move returned is a chess.Move
+def iterative_deepening(
+    board: chess.Board,
+    max_depth: int,
+    transposition_table: TranspositionTable,
+    movetime: Optional[float] = None,
+) -> Tuple[Optional[chess.Move], float]:
+    global time_control, root_ply
+    time_control = TimeControl(movetime)
+    time_control.start()
+    # The search runs on a copy that keeps its Zobrist key incrementally, so an
+    # aborted iteration leaves the caller's board untouched
+    board = SearchBoard.from_board(board)
+    transposition_table.new_search()
+    eval_cache.new_search()
+    move_cache.new_search()
+    heuristics.new_search()
+    root_ply = len(board.move_stack)
+    for name in search_stats:
+        search_stats[name] = 0
+    best_move = 0
+    best_score = 0.0
+
+    for depth in range(1, max_depth + 1):
+        try:
+            move, score = aspiration_search(
+                board, depth, transposition_table, best_move, best_score
+            )
+        except SearchTimeout:
+            break
+        best_move, best_score = move, score
+        # A forced mate was found, searching deeper will not change the move
+        if abs(best_score) >= MATE_SCORE - depth:
+            break
+        if not time_control.can_start_iteration():
+            break
+
+    search_stats["move_cache_hits"] = move_cache.hits
+    search_stats["move_cache_misses"] = move_cache.misses
+    move = decode_move(best_move) or next(iter(board.legal_moves), None)
+    # Callers expect the score from White's point of view
+    return move, best_score if board.turn == chess.WHITE else -best_score
@@ -1,10 +1,14 @@
-from typing import Dict, List, Optional
+from typing import List, Optional
 
 import chess
 from chess.polyglot import zobrist_hash
 from Tables import piece_tables
+from Transposition import EXACT, LOWER, UPPER, TranspositionTable, encode_move
 
-transposition_table: Dict[int, float] = {}
+# Largura da janela nula usada para testar os lances depois do primeiro
+NULL_WINDOW = 0.01
+
+transposition_table = TranspositionTable()
 
 
 # Função que determina se estamos no final de jogo
@@ -136,19 +140,44 @@ def quiescence(alpha: float, beta: float, board: chess.Board) -> float:
     return alpha
 
 
-# Função principal de busca Minimax com poda alfa-beta
+# Save a node result with the bound type given by the window it was searched with
+def store_search_result(
+    board_hash: int,
+    depth: int,
+    score: float,
+    alpha: float,
+    beta: float,
+    best_move: Optional[chess.Move],
+) -> None:
+    if score <= alpha:
+        flag = UPPER
+    elif score >= beta:
+        flag = LOWER
+    else:
+        flag = EXACT
+    transposition_table.store(board_hash, depth, score, flag, encode_move(best_move))
+
+
+# Principal Variation Search (negamax): pontuações do ponto de vista de quem
+# joga. O primeiro lance usa a janela completa, os outros uma janela nula, e só
+# são refeitos com a janela completa se passarem de alpha
 def minimax_alpha_beta(
-    depth: int, alpha: float, beta: float, is_maximizing: bool, board: chess.Board
+    depth: int, alpha: float, beta: float, board: chess.Board
 ) -> float:
     board_hash = zobrist_hash(board)
 
-    if board_hash in transposition_table:
-        return transposition_table[board_hash]
+    alpha_orig = alpha
+
+    tt_score, _ = transposition_table.probe(board_hash, depth, alpha, beta)
+    if tt_score is not None:
+        return tt_score
 
     if depth == 0 or board.is_game_over():
         score = evaluate_board(board)
         # score = quiescence(-999999, 999999, board)
-        transposition_table[board_hash] = score
+        if board.turn == chess.BLACK:
+            score = -score
+        transposition_table.store(board_hash, depth, score, EXACT, 0)
         return score
 
     moves = sorted(
@@ -156,48 +185,48 @@ def minimax_alpha_beta(
         key=lambda m: move_priority(board, m),
         reverse=board.turn != chess.BLACK,
     )
-    if is_maximizing:
-        max_eval = -999999
-        for move in moves:
-            board.push(move)
-            eval = minimax_alpha_beta(depth - 1, alpha, beta, False, board)
-            board.pop()
-            max_eval = max(max_eval, eval)
-            alpha = max(alpha, eval)
-            if beta <= alpha:
-                break
-        transposition_table[board_hash] = max_eval
-        return max_eval
-    else:
-        min_eval = 999999
-        for move in moves:
-            board.push(move)
-            eval = minimax_alpha_beta(depth - 1, alpha, beta, True, board)
-            board.pop()
-            min_eval = min(min_eval, eval)
-            beta = min(beta, eval)
-            if beta <= alpha:
+    best_score = -999999
+    best_move = None
+    for i, move in enumerate(moves):
+        board.push(move)
+        if i == 0:
+            score = -minimax_alpha_beta(depth - 1, -beta, -alpha, board)
+        else:
+            score = -minimax_alpha_beta(depth - 1, -alpha - NULL_WINDOW, -alpha, board)
+            if alpha < score < beta:
+                score = -minimax_alpha_beta(depth - 1, -beta, -alpha, board)
+        board.pop()
+        if best_move is None or score > best_score:
+            best_score = score
+            best_move = move
+        if score > alpha:
+            alpha = score
+            if alpha >= beta:
                 break
-        transposition_table[board_hash] = min_eval
-        return min_eval
+    store_search_result(board_hash, depth, best_score, alpha_orig, beta, best_move)
+    return best_score
 
 
 # Função para obter o melhor movimento
 def get_best_move(board: chess.Board, depth: int) -> Optional[chess.Move]:
+    # PVS também na raiz, do ponto de vista de quem joga
     best_move = None
-    best_score = -999999 if board.turn == chess.WHITE else 999999
+    alpha, beta = -999999, 999999
     moves = sorted(
         board.legal_moves,
         key=lambda m: move_priority(board, m),
         reverse=board.turn != chess.BLACK,
     )
-    for move in moves:
+    for i, move in enumerate(moves):
         board.push(move)
-        score = minimax_alpha_beta(
-            depth - 1, -999999, 999999, board.turn == chess.WHITE, board
-        )
+        if i == 0:
+            score = -minimax_alpha_beta(depth - 1, -beta, -alpha, board)
+        else:
+            score = -minimax_alpha_beta(depth - 1, -alpha - NULL_WINDOW, -alpha, board)
+            if score > alpha:
+                score = -minimax_alpha_beta(depth - 1, -beta, -alpha, board)
         board.pop()
-        if score >= best_score if board.turn == chess.WHITE else score <= best_score:
-            best_score = score
+        if best_move is None or score > alpha:
+            alpha = score
             best_move = move
     return best_move
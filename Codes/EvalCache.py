@@ -0,0 +1,47 @@
+from array import array
+from typing import Optional
+
+# key (8) + score (8)
+ENTRY_BYTES = 16
+
+
+# Static evaluations by Zobrist key, kept apart from the transposition table so
+# the many leaf entries never push out deeper search results. One entry per
+# slot (direct-mapped): a new position simply overwrites the old one. Scores
+# depend only on the position, so entries stay valid between searches
+class EvalCache:
+    def __init__(self, size_mb: float = 4):
+        # Number of entries is a power of two so the index is a simple mask
+        entries = max(1, int(size_mb * 1024 * 1024) // ENTRY_BYTES)
+        self.size = 1 << (entries.bit_length() - 1)
+        self.mask = self.size - 1
+        self.hits = 0
+        self.misses = 0
+        self.clear()
+
+    def clear(self) -> None:
+        self.keys = array("Q", bytes(8 * self.size))
+        self.scores = array("d", bytes(8 * self.size))
+
+    # Only the counters are reset, the evaluations are still good
+    def new_search(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    def probe(self, key: int) -> Optional[float]:
+        index = key & self.mask
+        if self.keys[index] == key:
+            self.hits += 1
+            return self.scores[index]
+        self.misses += 1
+        return None
+
+    def store(self, key: int, score: float) -> None:
+        index = key & self.mask
+        self.keys[index] = key
+        self.scores[index] = score
+
+    # Percentage of the probes of this search that found their position
+    def hit_rate(self) -> float:
+        probes = self.hits + self.misses
+        return 100.0 * self.hits / probes if probes else 0.0
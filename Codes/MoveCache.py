@@ -0,0 +1,44 @@
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+# Move lists by Zobrist key, for positions the search expands more than once
+# (each iteration of iterative deepening, aspiration and PVS re-searches,
+# quiescence reached again through other move orders). Callers store what they
+# generated, as packed moves (Transposition.encode_move), already ordered when
+# the order depends only on the position. Bounded: when full, the least
+# recently used position is dropped
+class MoveCache:
+    def __init__(self, max_entries: int = 1 << 15):
+        self.max_entries = max(1, max_entries)
+        self.entries: "OrderedDict[int, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    # Only the counters are reset, the move lists are still good
+    def new_search(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    def probe(self, key: int) -> Optional[Any]:
+        lists = self.entries.get(key)
+        if lists is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return lists
+
+    def store(self, key: int, lists: Any) -> None:
+        self.entries[key] = lists
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    # Percentage of the probes of this search that found their position
+    def hit_rate(self) -> float:
+        probes = self.hits + self.misses
+        return 100.0 * self.hits / probes if probes else 0.0
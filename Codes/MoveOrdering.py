@@ -0,0 +1,271 @@
+from array import array
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import chess
+from Attacks import is_safe_move, pinned_pieces
+from MoveCache import MoveCache
+from StaticExchange import see
+from Transposition import decode_move, encode_move
+
+MAX_PLY = 128
+KILLER_SLOTS = 2
+# History scores are halved when one of them gets above this
+HISTORY_MAX = 1 << 20
+# Ordering keys of killers and countermoves, above any history score
+KILLER_SCORE = HISTORY_MAX * 4
+COUNTER_SCORE = HISTORY_MAX * 3
+
+# 6 piece types for each colour
+PIECE_INDEXES = 12
+# From and to squares of a packed move, without the promotion
+SQUARES_MASK = (1 << 12) - 1
+
+
+# Index (0-11) of a piece from its type and colour
+def piece_index(piece_type: chess.PieceType, color: chess.Color) -> int:
+    return piece_type - 1 + 6 * color
+
+
+# Index of the previous move (moved piece and destination), -1 at the root or
+# after a null move
+def previous_move_index(board: chess.Board) -> int:
+    if not board.move_stack:
+        return -1
+    previous = board.move_stack[-1]
+    if not previous:
+        return -1
+    to_square = previous.to_square
+    piece_type = board.piece_type_at(to_square)
+    if piece_type is None:
+        return -1
+    return piece_index(piece_type, not board.turn) * 64 + to_square
+
+
+# Killer moves, countermoves and history tables for ordering quiet moves. Every
+# move here is packed (Transposition.encode_move).
+# Killers: two moves per ply that caused a beta cutoff.
+# Countermoves: the quiet move that last refuted each (piece, to square) move
+# of the opponent.
+# History: a score per colour and move, indexed by the from and to bits of the
+# packed move, raised by quiet moves that caused a cutoff and lowered for the
+# quiet moves searched before them.
+# Continuation history: the same, but per previous move (piece, to square)
+# and current move (piece, to square)
+class MoveHeuristics:
+    def __init__(self):
+        self.killers = array("H", bytes(2 * MAX_PLY * KILLER_SLOTS))
+        self.history = array("i", bytes(4 * 2 * 64 * 64))
+        self.countermoves = array("H", bytes(2 * PIECE_INDEXES * 64))
+        self.continuation = array("i", bytes(4 * (PIECE_INDEXES * 64) ** 2))
+
+    # Killers only make sense inside one search; history is kept but aged
+    def new_search(self) -> None:
+        self.killers = array("H", bytes(2 * MAX_PLY * KILLER_SLOTS))
+        self.age_history()
+
+    def age_history(self) -> None:
+        history = self.history
+        for i in range(len(history)):
+            history[i] //= 2
+
+    def age_continuation(self) -> None:
+        continuation = self.continuation
+        for i in range(len(continuation)):
+            continuation[i] //= 2
+
+    def is_killer(self, packed: int, ply: int) -> bool:
+        if ply >= MAX_PLY:
+            return False
+        index = ply * KILLER_SLOTS
+        return self.killers[index] == packed or self.killers[index + 1] == packed
+
+    # Ordering key of a quiet move: killers first, then the countermove, then
+    # history plus continuation history. previous is previous_move_index(board)
+    def quiet_score(
+        self, board: chess.Board, packed: int, ply: int, previous: int
+    ) -> int:
+        if self.is_killer(packed, ply):
+            return KILLER_SCORE
+        color = board.turn
+        score = self.history[color << 12 | packed & SQUARES_MASK]
+        if previous >= 0:
+            if self.countermoves[previous] == packed:
+                return COUNTER_SCORE
+            piece_type = board.piece_type_at(packed & 63)
+            current = piece_index(piece_type, color) * 64 + (packed >> 6 & 63)
+            score += self.continuation[previous * PIECE_INDEXES * 64 + current]
+        return score
+
+    # Called when the quiet move `packed` caused a beta cutoff at this ply
+    def update(
+        self,
+        board: chess.Board,
+        packed: int,
+        depth: int,
+        ply: int,
+        searched_quiets: List[int],
+    ) -> None:
+        if ply < MAX_PLY:
+            index = ply * KILLER_SLOTS
+            if self.killers[index] != packed:
+                self.killers[index + 1] = self.killers[index]
+                self.killers[index] = packed
+
+        previous = previous_move_index(board)
+        if previous >= 0:
+            self.countermoves[previous] = packed
+
+        bonus = depth * depth
+        for quiet in searched_quiets:
+            self.update_history(board, quiet, previous, -bonus)
+        self.update_history(board, packed, previous, bonus)
+
+    def update_history(
+        self, board: chess.Board, packed: int, previous: int, bonus: int
+    ) -> None:
+        color = board.turn
+        history = self.history
+        index = color << 12 | packed & SQUARES_MASK
+        history[index] += bonus
+        if abs(history[index]) > HISTORY_MAX:
+            self.age_history()
+
+        if previous >= 0:
+            continuation = self.continuation
+            piece_type = board.piece_type_at(packed & 63)
+            current = piece_index(piece_type, color) * 64 + (packed >> 6 & 63)
+            index = previous * PIECE_INDEXES * 64 + current
+            continuation[index] += bonus
+            if abs(continuation[index]) > HISTORY_MAX:
+                self.age_continuation()
+
+
+# Move generator of the side to move and a test that the moves it yields are
+# legal: pseudo-legal moves checked against the pins when not in check, the
+# legal evasions directly when in check
+def legal_generator(board: chess.Board) -> Tuple[Callable, Callable]:
+    if board.is_check():
+        return board.generate_legal_moves, lambda move: True
+    king = board.king(board.turn)
+    if king is None:
+        return board.generate_pseudo_legal_moves, lambda move: True
+    pinned = pinned_pieces(board, board.turn, king)
+    return (
+        board.generate_pseudo_legal_moves,
+        lambda move: is_safe_move(board, move, king, pinned),
+    )
+
+
+# Legal move lists of the side to move, as packed moves: [captures and
+# promotions that do not lose material, losing ones (both best static exchange
+# first), quiet moves]. The quiet moves stay None until staged_moves first
+# needs them. With a cache the lists are kept by the board's Zobrist key and
+# only generated the first time the position is expanded
+def move_lists(board: chess.Board, cache: Optional[MoveCache] = None) -> list:
+    if cache is not None:
+        lists = cache.probe(board.key)
+        if lists is not None:
+            return lists
+
+    generate, is_legal = legal_generator(board)
+    targets = board.occupied_co[not board.turn]
+    if board.ep_square is not None:
+        targets |= chess.BB_SQUARES[board.ep_square]
+    captures = [
+        (see(board, move), move)
+        for move in generate(to_mask=targets)
+        if board.is_capture(move) and is_legal(move)
+    ]
+    promotions = chess.BB_BACKRANKS & ~board.occupied
+    captures.extend(
+        (see(board, move), move)
+        for move in generate(from_mask=board.pawns, to_mask=promotions)
+        if is_legal(move)
+    )
+    captures.sort(key=lambda capture: capture[0], reverse=True)
+    lists = [
+        array("H", [encode_move(move) for exchange, move in captures if exchange >= 0]),
+        array("H", [encode_move(move) for exchange, move in captures if exchange < 0]),
+        None,
+    ]
+    if cache is not None:
+        cache.store(board.key, lists)
+    return lists
+
+
+# Legal quiet moves of the side to move, in generation order. Castling moves the
+# king onto its own rook in python-chess, so it is not found by the empty-square
+# mask
+def quiet_moves(board: chess.Board) -> List[chess.Move]:
+    generate, is_legal = legal_generator(board)
+    quiets = [
+        move
+        for move in generate(to_mask=chess.BB_ALL & ~board.occupied)
+        if move.promotion is None and not board.is_en_passant(move) and is_legal(move)
+    ]
+    if not board.is_check():
+        quiets.extend(board.generate_castling_moves())
+    return quiets
+
+
+# Captures (no quiet promotions) that do not lose material, best static exchange
+# first, for quiescence
+def winning_captures(
+    board: chess.Board, cache: Optional[MoveCache] = None
+) -> Iterator[chess.Move]:
+    for packed in move_lists(board, cache)[0]:
+        move = decode_move(packed)
+        if board.is_capture(move):
+            yield move
+
+
+# Staged move picker. Packed moves are yielded in order: the hash move, the
+# captures and promotions that do not lose material (best static exchange
+# first), the killers, the other quiet moves by countermove/history score and
+# last the losing captures. The quiet moves are only generated when the previous
+# stages did not produce a cutoff; with a cache, a position expanded again takes
+# all of its lists from there
+def staged_moves(
+    board: chess.Board,
+    hash_move: int,
+    heuristics: MoveHeuristics,
+    ply: int = 0,
+    cache: Optional[MoveCache] = None,
+) -> Iterator[int]:
+    tried: List[int] = []
+    if hash_move and board.is_legal(decode_move(hash_move)):
+        tried.append(hash_move)
+        yield hash_move
+
+    lists = move_lists(board, cache)
+    for packed in lists[0]:
+        if packed not in tried:
+            yield packed
+
+    # Killers of this ply, if they are quiet and playable here
+    if ply < MAX_PLY:
+        index = ply * KILLER_SLOTS
+        for slot in range(index, index + KILLER_SLOTS):
+            killer = heuristics.killers[slot]
+            if not killer or killer in tried or killer >> 12:
+                continue
+            move = decode_move(killer)
+            if board.is_capture(move) or not board.is_legal(move):
+                continue
+            tried.append(killer)
+            yield killer
+
+    # Remaining quiet moves
+    if lists[2] is None:
+        lists[2] = array("H", [encode_move(move) for move in quiet_moves(board)])
+    previous = previous_move_index(board)
+    quiets = [packed for packed in lists[2] if packed not in tried]
+    quiets.sort(
+        key=lambda packed: heuristics.quiet_score(board, packed, ply, previous),
+        reverse=True,
+    )
+    yield from quiets
+
+    for packed in lists[1]:
+        if packed not in tried:
+            yield packed
@@ -0,0 +1,105 @@
+from typing import List
+
+import chess
+from EvalCache import EvalCache
+from SearchBoard import SearchBoard
+
+# Pawn structure terms, in pawns
+PASSED_PAWN_BONUS = [0.0, 0.2, 0.3, 0.5, 0.8, 1.3, 2.0, 0.0]  # by relative rank
+ISOLATED_PAWN_PENALTY = 0.3
+DOUBLED_PAWN_PENALTY = 0.3
+BACKWARD_PAWN_PENALTY = 0.2
+
+
+# Files next to each file
+def build_adjacent_files() -> List[int]:
+    masks = []
+    for file in range(8):
+        mask = 0
+        if file > 0:
+            mask |= chess.BB_FILES[file - 1]
+        if file < 7:
+            mask |= chess.BB_FILES[file + 1]
+        masks.append(mask)
+    return masks
+
+
+ADJACENT_FILES = build_adjacent_files()
+
+
+# Ranks strictly in front of `rank` for `color`
+def ranks_ahead(rank: int, color: chess.Color) -> int:
+    mask = 0
+    for other in range(8):
+        if (other > rank) if color == chess.WHITE else (other < rank):
+            mask |= chess.BB_RANKS[other]
+    return mask
+
+
+# Per colour and square: the squares in front on the same file (front span),
+# the front span plus the adjacent files (no enemy pawn there means passed), and
+# the squares on the adjacent files level with or behind the pawn (where the
+# pawns that could defend it stand)
+def build_spans():
+    front = [[0] * 64 for _ in chess.COLORS]
+    passed = [[0] * 64 for _ in chess.COLORS]
+    support = [[0] * 64 for _ in chess.COLORS]
+    for color in chess.COLORS:
+        for square in chess.SQUARES:
+            file = chess.square_file(square)
+            rank = chess.square_rank(square)
+            ahead = ranks_ahead(rank, color)
+            front[color][square] = ahead & chess.BB_FILES[file]
+            passed[color][square] = ahead & (
+                chess.BB_FILES[file] | ADJACENT_FILES[file]
+            )
+            support[color][square] = ~ahead & ADJACENT_FILES[file] & chess.BB_ALL
+    return front, passed, support
+
+
+FRONT_SPAN, PASSED_SPAN, SUPPORT_SPAN = build_spans()
+
+
+# Pawn structure score of one side's pawns against the other side's pawns
+def side_pawn_score(own: int, enemy: int, color: chess.Color) -> float:
+    score = 0.0
+    for square in chess.scan_forward(own):
+        file = chess.square_file(square)
+        isolated = not own & ADJACENT_FILES[file]
+        if isolated:
+            score -= ISOLATED_PAWN_PENALTY
+        if own & FRONT_SPAN[color][square]:
+            # Counted once for every pawn with a friendly pawn in front of it
+            score -= DOUBLED_PAWN_PENALTY
+        elif not enemy & PASSED_SPAN[color][square]:
+            rank = chess.square_rank(square)
+            score += PASSED_PAWN_BONUS[rank if color == chess.WHITE else 7 - rank]
+
+        # Backward: no friendly pawn can come to its defence and the square in
+        # front of it is controlled by an enemy pawn
+        if not isolated and not own & SUPPORT_SPAN[color][square]:
+            stop = square + 8 if color == chess.WHITE else square - 8
+            if 0 <= stop < 64 and chess.BB_PAWN_ATTACKS[color][stop] & enemy:
+                score -= BACKWARD_PAWN_PENALTY
+    return score
+
+
+# Pawn structure score from White's point of view
+def evaluate_pawns(white_pawns: int, black_pawns: int) -> float:
+    white = side_pawn_score(white_pawns, black_pawns, chess.WHITE)
+    black = side_pawn_score(black_pawns, white_pawns, chess.BLACK)
+    return white - black
+
+
+# Pawn structure score of `board` (White's point of view), looked up in
+# `pawn_table` by the pawn-only Zobrist key. Pawns move and get captured far
+# less often than the other pieces, so almost every call is a hit
+def pawn_structure_score(board: SearchBoard, pawn_table: EvalCache) -> float:
+    key = board.pawn_key
+    score = pawn_table.probe(key)
+    if score is None:
+        white_pawns = board.pawns & board.occupied_co[chess.WHITE]
+        black_pawns = board.pawns & board.occupied_co[chess.BLACK]
+        score = evaluate_pawns(white_pawns, black_pawns)
+        pawn_table.store(key, score)
+    return score
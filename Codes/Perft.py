@@ -0,0 +1,218 @@
+import argparse
+import os
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import chess
+from SearchBoard import SearchBoard
+
+# Move generation benchmark and correctness check: counts the leaf nodes of the
+# legal move tree to a fixed depth on the board the search uses (python-chess
+# move generation plus SearchBoard make/unmake). Run before and after any change
+# to either, e.g.
+#   python Codes/Perft.py --depth 5
+#   python Codes/Perft.py --fen "<fen>" --depth 4 --divide
+#   python Codes/Perft.py --suite --max-depth 4 --workers 4 --hash 64
+EPD_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "perft.epd")
+
+# key (8) + depth (1) + count (8)
+ENTRY_BYTES = 17
+
+
+# Subtree counts by Zobrist key and depth, direct-mapped: a new entry simply
+# overwrites the old one
+class PerftCache:
+    def __init__(self, size_mb: float = 16):
+        # Number of entries is a power of two so the index is a simple mask
+        entries = max(1, int(size_mb * 1024 * 1024) // ENTRY_BYTES)
+        self.size = 1 << (entries.bit_length() - 1)
+        self.mask = self.size - 1
+        self.keys = array("Q", bytes(8 * self.size))
+        self.depths = array("B", bytes(self.size))
+        self.counts = array("Q", bytes(8 * self.size))
+        self.hits = 0
+
+    def probe(self, key: int, depth: int) -> Optional[int]:
+        index = (key ^ depth) & self.mask
+        if self.keys[index] == key and self.depths[index] == depth:
+            self.hits += 1
+            return self.counts[index]
+        return None
+
+    def store(self, key: int, depth: int, count: int) -> None:
+        index = (key ^ depth) & self.mask
+        self.keys[index] = key
+        self.depths[index] = depth
+        self.counts[index] = count
+
+
+# Leaf nodes of the legal move tree of `board` at `depth`. The last ply only
+# counts the moves instead of making them
+def perft(board: SearchBoard, depth: int, cache: Optional[PerftCache] = None) -> int:
+    if depth <= 1:
+        return sum(1 for _ in board.generate_legal_moves()) if depth == 1 else 1
+    if cache is not None:
+        count = cache.probe(board.key, depth)
+        if count is not None:
+            return count
+    count = 0
+    for move in board.generate_legal_moves():
+        board.push(move)
+        count += perft(board, depth - 1, cache)
+        board.pop()
+    if cache is not None:
+        cache.store(board.key, depth, count)
+    return count
+
+
+# Cache of each worker process, created by the pool initializer
+worker_cache: Optional[PerftCache] = None
+
+
+def init_worker(hash_mb: float) -> None:
+    global worker_cache
+    worker_cache = PerftCache(hash_mb) if hash_mb else None
+
+
+# Count below one root move, in a worker process
+def perft_after_move(fen: str, uci: str, depth: int) -> int:
+    board = SearchBoard(fen)
+    board.push(chess.Move.from_uci(uci))
+    return perft(board, depth - 1, worker_cache)
+
+
+# Count below each root move, as (move, count) in generation order. With
+# `workers` above 1 the root moves are split across that many processes
+def divide(
+    board: SearchBoard,
+    depth: int,
+    hash_mb: float = 0,
+    workers: int = 1,
+) -> List[Tuple[chess.Move, int]]:
+    moves = list(board.generate_legal_moves())
+    if workers > 1:
+        fen = board.fen()
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=init_worker, initargs=(hash_mb,)
+        ) as pool:
+            counts = pool.map(
+                perft_after_move,
+                [fen] * len(moves),
+                [move.uci() for move in moves],
+                [depth] * len(moves),
+            )
+            return list(zip(moves, counts))
+
+    cache = PerftCache(hash_mb) if hash_mb else None
+    result = []
+    for move in moves:
+        board.push(move)
+        result.append((move, perft(board, depth - 1, cache)))
+        board.pop()
+    return result
+
+
+# Positions of the EPD file as (fen, {depth: count}), lines like
+# "<fen> ;D1 20 ;D2 400"
+def load_epd(filename: str = EPD_FILE) -> List[Tuple[str, dict]]:
+    positions = []
+    with open(filename) as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fields = line.split(";")
+            expected = {}
+            for field in fields[1:]:
+                name, value = field.split()
+                expected[int(name[1:])] = int(value)
+            positions.append((fields[0].strip(), expected))
+    return positions
+
+
+def format_rate(nodes: int, seconds: float) -> str:
+    return f"{nodes} nodes in {seconds:.2f}s ({nodes / max(seconds, 1e-9):,.0f} nps)"
+
+
+# Total of one position at one depth, timed
+def run_perft(fen: str, depth: int, hash_mb: float, workers: int) -> Tuple[int, float]:
+    board = SearchBoard(fen)
+    start = time.perf_counter()
+    if depth <= 1:
+        nodes = perft(board, depth)
+    else:
+        nodes = sum(count for _, count in divide(board, depth, hash_mb, workers))
+    return nodes, time.perf_counter() - start
+
+
+# Checks every position of the EPD file up to `max_depth` against its
+# reference counts; True when all of them match
+def run_suite(filename: str, max_depth: int, hash_mb: float, workers: int) -> bool:
+    passed = True
+    total_nodes = 0
+    total_time = 0.0
+    for fen, expected in load_epd(filename):
+        for depth in sorted(expected):
+            if depth > max_depth:
+                break
+            nodes, seconds = run_perft(fen, depth, hash_mb, workers)
+            total_nodes += nodes
+            total_time += seconds
+            ok = nodes == expected[depth]
+            passed = passed and ok
+            status = "ok" if ok else f"FAIL (expected {expected[depth]})"
+            print(f"{fen} depth {depth}: {format_rate(nodes, seconds)} {status}")
+    print(f"Total: {format_rate(total_nodes, total_time)}")
+    print("All counts match" if passed else "Some counts DO NOT match")
+    return passed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Perft move generation benchmark")
+    parser.add_argument("--fen", default=chess.STARTING_FEN)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument(
+        "--divide", action="store_true", help="print the count below each root move"
+    )
+    parser.add_argument(
+        "--hash", type=float, default=0, help="perft cache size in MB (0: no cache)"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="processes the root moves are split on"
+    )
+    parser.add_argument(
+        "--suite",
+        nargs="?",
+        const=EPD_FILE,
+        help="check the positions of an EPD file (default: perft.epd)",
+    )
+    parser.add_argument(
+        "--max-depth", type=int, default=4, help="deepest depth checked by --suite"
+    )
+    args = parser.parse_args()
+
+    if args.suite:
+        return (
+            0 if run_suite(args.suite, args.max_depth, args.hash, args.workers) else 1
+        )
+
+    if args.divide and args.depth >= 1:
+        start = time.perf_counter()
+        result = divide(SearchBoard(args.fen), args.depth, args.hash, args.workers)
+        for move, count in result:
+            print(f"{move.uci()}: {count}")
+        nodes = sum(count for _, count in result)
+        seconds = time.perf_counter() - start
+        print(f"Moves: {len(result)}")
+    else:
+        nodes, seconds = run_perft(args.fen, args.depth, args.hash, args.workers)
+
+    print(f"Depth {args.depth}: {format_rate(nodes, seconds)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,424 @@
+from array import array
+from typing import List, Optional, Tuple
+
+import chess
+from chess.polyglot import POLYGLOT_RANDOM_ARRAY, ZobristHasher, zobrist_hash
+from Tables import piece_tables
+
+hasher = ZobristHasher(POLYGLOT_RANDOM_ARRAY)
+
+PIECE_VALUES = [0, 1, 3, 3.2, 5, 9, 0]
+
+
+# Material plus piece-square value of every (piece index, square), from White's
+# point of view, indexed like the Zobrist keys: 64 * piece index + square.
+# The endgame set uses the endgame king and pawn tables
+def build_piece_square_values(endgame: bool) -> List[float]:
+    values = [0.0] * (12 * 64)
+    for piece_type in chess.PIECE_TYPES:
+        table = piece_tables[piece_type]
+        if endgame and piece_type == chess.KING:
+            table = piece_tables["K_end"]
+        elif endgame and piece_type == chess.PAWN:
+            table = piece_tables["P_end"]
+        for color in chess.COLORS:
+            index = (piece_type - 1) * 2 + color
+            for square in chess.SQUARES:
+                if color == chess.WHITE:
+                    value = PIECE_VALUES[piece_type] + table[square]
+                else:
+                    value = (
+                        -PIECE_VALUES[piece_type] - table[chess.square_mirror(square)]
+                    )
+                values[64 * index + square] = value
+    return values
+
+
+MIDDLEGAME_VALUES = build_piece_square_values(False)
+ENDGAME_VALUES = build_piece_square_values(True)
+
+# Game phase: weight of each piece type and the total with all pieces on the
+# board. The score goes from the middlegame tables at TOTAL_PHASE to the
+# endgame tables at 0
+PHASE_WEIGHTS = [0, 0, 1, 1, 2, 4, 0]
+TOTAL_PHASE = 24
+
+# Black and white pawns are the first two piece indexes
+PAWN_INDEXES = 2
+
+
+# Bitboard of each piece in Polyglot order: index (piece type - 1) * 2 + colour
+def piece_masks(board: chess.BaseBoard) -> Tuple[int, ...]:
+    black, white = board.occupied_co
+    return (
+        board.pawns & black,
+        board.pawns & white,
+        board.knights & black,
+        board.knights & white,
+        board.bishops & black,
+        board.bishops & white,
+        board.rooks & black,
+        board.rooks & white,
+        board.queens & black,
+        board.queens & white,
+        board.kings & black,
+        board.kings & white,
+    )
+
+
+# Polyglot key of the side to move, it changes on every move
+TURN_KEY = POLYGLOT_RANDOM_ARRAY[780]
+
+
+# Board used inside the search. Besides the python-chess bitboards it keeps a
+# mailbox (piece index of every square, -1 when empty) and, up to date on every
+# move, the Polyglot Zobrist key of the position (`key`, always equal to
+# zobrist_hash(board)), the material plus piece-square sums of the middlegame and
+# endgame tables (`middlegame`, `endgame`, from White's point of view), the game
+# `phase` and the Zobrist key of the pawns alone (`pawn_key`).
+# push and pop make and unmake the move in place: only the squares the move
+# touches are changed and undone, and the state needed to take it back is kept
+# as one small tuple per move instead of a full snapshot of the board. Only push
+# and pop update the extra state; other ways of changing the position (set_fen,
+# set_piece_at...) must not be used on it. Positions are converted from and to
+# chess.Board at the root of the search only
+class SearchBoard(chess.Board):
+    __slots__ = (
+        "mailbox",
+        "key",
+        "key_stack",
+        "middlegame",
+        "endgame",
+        "phase",
+        "pawn_key",
+        "undo_stack",
+    )
+
+    def __init__(
+        self, fen: Optional[str] = chess.STARTING_FEN, *, chess960: bool = False
+    ):
+        # Empty while python-chess sets up the position on a cleared board, it
+        # is filled from the bitboards below
+        self.mailbox = array("b", [-1] * 64)
+        super().__init__(fen, chess960=chess960)
+        # Filtered once here, the moves keep them clean from now on
+        self.castling_rights = super().clean_castling_rights()
+        self.middlegame = 0.0
+        self.endgame = 0.0
+        self.phase = 0
+        self.pawn_key = 0
+        for index, mask in enumerate(piece_masks(self)):
+            for square in chess.scan_forward(mask):
+                self.mailbox[square] = index
+                self.middlegame += MIDDLEGAME_VALUES[64 * index + square]
+                self.endgame += ENDGAME_VALUES[64 * index + square]
+                self.phase += PHASE_WEIGHTS[index // 2 + 1]
+                if index < PAWN_INDEXES:
+                    self.pawn_key ^= POLYGLOT_RANDOM_ARRAY[64 * index + square]
+        self.key = zobrist_hash(self)
+        # Key of the position before each move of the move stack
+        self.key_stack: List[int] = []
+        # What each move of the move stack needs to be taken back: (moved piece,
+        # captured piece, capture square, castling rights, en passant square,
+        # halfmove clock, middlegame, endgame, phase, pawn key)
+        self.undo_stack: List[Tuple] = []
+
+    # Search board with the same position and move stack as `board`; the moves
+    # are replayed from the root position so every key on the stack is known
+    @classmethod
+    def from_board(cls, board: chess.Board) -> "SearchBoard":
+        search_board = cls(board.root().fen(), chess960=board.chess960)
+        for move in board.move_stack:
+            search_board.push(move)
+        return search_board
+
+    # Plain chess.Board with the same position and move stack
+    def to_board(self) -> chess.Board:
+        board = chess.Board(self.root().fen(), chess960=self.chess960)
+        for move in self.move_stack:
+            board.push(move)
+        return board
+
+    # Adds or removes the piece `index` on `square` in the bitboards
+    def toggle_piece(self, index: int, square: int) -> None:
+        mask = chess.BB_SQUARES[square]
+        piece_type = index >> 1
+        if piece_type == 0:
+            self.pawns ^= mask
+        elif piece_type == 1:
+            self.knights ^= mask
+        elif piece_type == 2:
+            self.bishops ^= mask
+        elif piece_type == 3:
+            self.rooks ^= mask
+        elif piece_type == 4:
+            self.queens ^= mask
+        else:
+            self.kings ^= mask
+        self.occupied ^= mask
+        self.occupied_co[index & 1] ^= mask
+
+    def push(self, move: chess.Move) -> None:
+        mailbox = self.mailbox
+        turn = self.turn
+        castling_rights = self.castling_rights
+        ep_square = self.ep_square
+        halfmove_clock = self.halfmove_clock
+        key = self.key ^ TURN_KEY
+        if ep_square is not None:
+            key ^= hasher.hash_ep_square(self)
+
+        self.key_stack.append(self.key)
+        self.move_stack.append(move)
+        self.halfmove_clock += 1
+        if turn == chess.BLACK:
+            self.fullmove_number += 1
+        self.ep_square = None
+
+        if not move:
+            # Null move: only the side to move and the en passant square change
+            self.undo_stack.append(
+                (
+                    -1,
+                    -1,
+                    -1,
+                    castling_rights,
+                    ep_square,
+                    halfmove_clock,
+                    self.middlegame,
+                    self.endgame,
+                    self.phase,
+                    self.pawn_key,
+                )
+            )
+            self.turn = not turn
+            self.key = key
+            return
+
+        from_square = move.from_square
+        to_square = move.to_square
+        piece = mailbox[from_square]
+        if piece >> 1 == 5:
+            # Castling is encoded as the king taking its own rook
+            to_square = self._to_chess960(move).to_square
+        captured = mailbox[to_square]
+        capture_square = to_square
+
+        # Castling rights only change when a king or a rook with rights moves
+        # or is captured; their key depends on where the king stands, so the
+        # old one is taken before moving anything
+        touched = chess.BB_SQUARES[from_square] | chess.BB_SQUARES[to_square]
+        rights_change = castling_rights and touched & (castling_rights | self.kings)
+        if rights_change:
+            key ^= hasher.hash_castling(self)
+            castling_rights &= ~touched
+            if piece >> 1 == 5:
+                castling_rights &= ~(
+                    chess.BB_RANK_1 if turn == chess.WHITE else chess.BB_RANK_8
+                )
+
+        # Squares whose piece changed, as (entry, added)
+        changes = []
+        if captured >= 0 and captured & 1 == turn:
+            rank = from_square & 56
+            if to_square < from_square:
+                king_to, rook_to = rank + 2, rank + 3
+            else:
+                king_to, rook_to = rank + 6, rank + 5
+            rook = captured
+            for index, square, added in (
+                (piece, from_square, False),
+                (rook, to_square, False),
+                (piece, king_to, True),
+                (rook, rook_to, True),
+            ):
+                self.toggle_piece(index, square)
+                mailbox[square] = index if added else -1
+                changes.append((64 * index + square, added))
+        else:
+            if piece < PAWN_INDEXES:
+                self.halfmove_clock = 0
+                if to_square == ep_square and captured < 0:
+                    capture_square = to_square ^ 8
+                    captured = mailbox[capture_square]
+                elif abs(to_square - from_square) == 16:
+                    self.ep_square = (from_square + to_square) >> 1
+            if captured >= 0:
+                self.halfmove_clock = 0
+                self.toggle_piece(captured, capture_square)
+                mailbox[capture_square] = -1
+                changes.append((64 * captured + capture_square, False))
+            placed = piece
+            if move.promotion:
+                placed = (move.promotion - 1) * 2 + turn
+            self.toggle_piece(piece, from_square)
+            self.toggle_piece(placed, to_square)
+            mailbox[from_square] = -1
+            mailbox[to_square] = placed
+            changes.append((64 * piece + from_square, False))
+            changes.append((64 * placed + to_square, True))
+
+        self.undo_stack.append(
+            (
+                piece,
+                captured,
+                capture_square,
+                self.castling_rights,
+                ep_square,
+                halfmove_clock,
+                self.middlegame,
+                self.endgame,
+                self.phase,
+                self.pawn_key,
+            )
+        )
+
+        self.turn = not turn
+        if rights_change:
+            self.castling_rights = castling_rights
+            key ^= hasher.hash_castling(self)
+        if self.ep_square is not None:
+            key ^= hasher.hash_ep_square(self)
+
+        # Only the few squares whose piece changed are hashed and scored
+        middlegame = self.middlegame
+        endgame = self.endgame
+        phase = self.phase
+        pawn_key = self.pawn_key
+        for entry, added in changes:
+            key ^= POLYGLOT_RANDOM_ARRAY[entry]
+            index = entry >> 6
+            if index < PAWN_INDEXES:
+                pawn_key ^= POLYGLOT_RANDOM_ARRAY[entry]
+            if added:
+                middlegame += MIDDLEGAME_VALUES[entry]
+                endgame += ENDGAME_VALUES[entry]
+                phase += PHASE_WEIGHTS[index // 2 + 1]
+            else:
+                middlegame -= MIDDLEGAME_VALUES[entry]
+                endgame -= ENDGAME_VALUES[entry]
+                phase -= PHASE_WEIGHTS[index // 2 + 1]
+        self.key = key
+        self.middlegame = middlegame
+        self.endgame = endgame
+        self.phase = phase
+        self.pawn_key = pawn_key
+
+    def pop(self) -> chess.Move:
+        move = self.move_stack.pop()
+        self.key = self.key_stack.pop()
+        (
+            piece,
+            captured,
+            capture_square,
+            self.castling_rights,
+            self.ep_square,
+            self.halfmove_clock,
+            self.middlegame,
+            self.endgame,
+            self.phase,
+            self.pawn_key,
+        ) = self.undo_stack.pop()
+        self.turn = turn = not self.turn
+        if turn == chess.BLACK:
+            self.fullmove_number -= 1
+        if piece < 0:
+            return move
+
+        mailbox = self.mailbox
+        from_square = move.from_square
+        if captured >= 0 and captured & 1 == turn:
+            # Castling: king and rook go back to the squares they came from
+            rank = from_square & 56
+            if capture_square < from_square:
+                king_to, rook_to = rank + 2, rank + 3
+            else:
+                king_to, rook_to = rank + 6, rank + 5
+            self.toggle_piece(piece, king_to)
+            self.toggle_piece(captured, rook_to)
+            mailbox[king_to] = -1
+            mailbox[rook_to] = -1
+            self.toggle_piece(piece, from_square)
+            self.toggle_piece(captured, capture_square)
+            mailbox[from_square] = piece
+            mailbox[capture_square] = captured
+            return move
+
+        to_square = move.to_square
+        self.toggle_piece(mailbox[to_square], to_square)
+        self.toggle_piece(piece, from_square)
+        mailbox[to_square] = -1
+        mailbox[from_square] = piece
+        if captured >= 0:
+            self.toggle_piece(captured, capture_square)
+            mailbox[capture_square] = captured
+        return move
+
+    # Piece type read from the mailbox instead of testing every bitboard
+    def piece_type_at(self, square: int) -> Optional[int]:
+        index = self.mailbox[square]
+        return (index >> 1) + 1 if index >= 0 else None
+
+    # The castling rights are filtered when the board is set up and every move
+    # keeps them clean
+    def clean_castling_rights(self) -> int:
+        return self.castling_rights
+
+    # Start position of the move stack, found by taking back every move
+    def root(self) -> "SearchBoard":
+        board = self.copy()
+        while board.move_stack:
+            board.pop()
+        return board
+
+    # Same position with the same side to move seen `count` times, by the
+    # Zobrist keys of the positions on the stack
+    def is_repetition(self, count: int = 3) -> bool:
+        key = self.key
+        key_stack = self.key_stack
+        seen = 1
+        for index in range(len(key_stack) - 2, -1, -2):
+            if key_stack[index] == key:
+                seen += 1
+                if seen >= count:
+                    return True
+        return False
+
+    # Material and piece-square score (White's point of view) interpolated
+    # between the middlegame and endgame tables by the game phase, so it does
+    # not jump when pieces come off the board
+    def tapered_score(self) -> float:
+        phase = min(self.phase, TOTAL_PHASE)
+        return (
+            self.middlegame * phase + self.endgame * (TOTAL_PHASE - phase)
+        ) / TOTAL_PHASE
+
+    # Draw as the search sees it: fifty moves without a capture or pawn move,
+    # insufficient material, or the position already seen once since the last
+    # irreversible move (a second repetition is not waited for, the side that
+    # repeated can always do it again). Only keys with the same side to move
+    # are compared
+    def is_search_draw(self) -> bool:
+        if self.halfmove_clock >= 100 or self.is_insufficient_material():
+            return True
+        key = self.key
+        key_stack = self.key_stack
+        last = len(key_stack)
+        first = max(last - self.halfmove_clock, 0)
+        for index in range(last - 2, first - 1, -2):
+            if key_stack[index] == key:
+                return True
+        return False
+
+    def copy(self, *, stack=True) -> "SearchBoard":
+        board = super().copy(stack=stack)
+        board.mailbox = array("b", self.mailbox)
+        board.key = self.key
+        board.middlegame = self.middlegame
+        board.endgame = self.endgame
+        board.phase = self.phase
+        board.pawn_key = self.pawn_key
+        first = len(self.key_stack) - len(board.move_stack)
+        board.key_stack = self.key_stack[first:]
+        board.undo_stack = self.undo_stack[first:]
+        return board
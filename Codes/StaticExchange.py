@@ -0,0 +1,85 @@
+import chess
+from AttackTables import attackers_to, bishop_attacks, rook_attacks
+
+# Piece values used by the exchange, the king is never captured
+SEE_VALUES = [0, 1, 3, 3.2, 5, 9, 0]
+
+
+# Least valuable piece among `attackers` (all of one colour), as (piece type,
+# bitboard of its square); `pieces` holds the bitboard of each piece type from
+# the pawns up
+def least_valuable_attacker(pieces, attackers: int):
+    for piece_type, bitboard in enumerate(pieces, chess.PAWN):
+        bitboard &= attackers
+        if bitboard:
+            return piece_type, bitboard & -bitboard
+    return None, 0
+
+
+# Static Exchange Evaluation: material won (in pawns) by the side to move after
+# `move` and the best sequence of recaptures on the destination square. Each
+# side always recaptures with its least valuable piece and may stop when going
+# on loses material. The attackers of both colours are found once; removing a
+# piece from `occupied` only adds the sliders behind it (x-rays)
+def see(board: chess.Board, move: chess.Move) -> float:
+    to_square = move.to_square
+    occupied = board.occupied ^ chess.BB_SQUARES[move.from_square]
+
+    if board.is_en_passant(move):
+        gain = SEE_VALUES[chess.PAWN]
+        occupied ^= chess.BB_SQUARES[to_square ^ 8]
+    else:
+        gain = SEE_VALUES[board.piece_type_at(to_square) or 0]
+
+    piece_on_square = board.piece_type_at(move.from_square)
+    if move.promotion:
+        gain += SEE_VALUES[move.promotion] - SEE_VALUES[chess.PAWN]
+        piece_on_square = move.promotion
+
+    pieces = (
+        board.pawns,
+        board.knights,
+        board.bishops,
+        board.rooks,
+        board.queens,
+        board.kings,
+    )
+    diagonal = board.bishops | board.queens
+    straight = board.rooks | board.queens
+    attackers = attackers_to(board, to_square, occupied)
+    gains = [gain]
+    color = not board.turn
+    while True:
+        piece_type, square_mask = least_valuable_attacker(
+            pieces, attackers & board.occupied_co[color]
+        )
+        if piece_type is None:
+            break
+        # The king can only take if the square is no longer defended
+        if piece_type == chess.KING and attackers & board.occupied_co[not color]:
+            break
+        gains.append(SEE_VALUES[piece_on_square] - gains[-1])
+        occupied ^= square_mask
+        if piece_type in (chess.PAWN, chess.BISHOP, chess.QUEEN):
+            attackers |= bishop_attacks(to_square, occupied) & diagonal
+        if piece_type in (chess.ROOK, chess.QUEEN):
+            attackers |= rook_attacks(to_square, occupied) & straight
+        attackers &= occupied
+        piece_on_square = piece_type
+        color = not color
+
+    # Each side can choose to stop capturing, going back from the end
+    for i in range(len(gains) - 1, 0, -1):
+        gains[i - 1] = -max(-gains[i - 1], gains[i])
+    return gains[0]
+
+
+# Material a capture or promotion wins before any recapture, used by delta pruning
+def capture_gain(board: chess.Board, move: chess.Move) -> float:
+    if board.is_en_passant(move):
+        gain = SEE_VALUES[chess.PAWN]
+    else:
+        gain = SEE_VALUES[board.piece_type_at(move.to_square) or 0]
+    if move.promotion:
+        gain += SEE_VALUES[move.promotion] - SEE_VALUES[chess.PAWN]
+    return gain
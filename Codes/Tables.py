@@ -1,4 +1,6 @@
 # trunk-ignore-all(black)
+import math
+
 import chess
 
 
@@ -103,4 +105,13 @@ manhattan_center_distance_king = [
     4, 3, 2, 1, 1, 2, 3, 4,
     5, 4, 3, 2, 2, 3, 4, 5,
     6, 5, 4, 3, 3, 4, 5, 6
-]
\ No newline at end of file
+]
+
+# Late move reductions: plies removed from the search of a quiet move, by [depth][move index]
+late_move_reductions = [
+    [
+        0 if depth < 3 or index < 3 else int(0.75 + math.log(depth) * math.log(index) / 2.25)
+        for index in range(64)
+    ]
+    for depth in range(64)
+]
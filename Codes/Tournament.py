@@ -4,6 +4,12 @@ import time
 
 import chess
 from EngineAIvsAI import get_best_move
+from Transposition import TranspositionTable
+
+# Tempo máximo por lance (segundos), None busca sempre até a profundidade
+MOVE_TIME = 5.0
+# Memória de cada tabela de transposição (MB)
+HASH_MB = 16
 
 board = chess.Board()
 
@@ -98,7 +104,7 @@ def ai_vs_ai(
     while not board.is_game_over():
         if board.turn == chess.WHITE:
             best_move = get_best_move(
-                board, depth_white, sequence, transposition_table_ai1
+                board, depth_white, sequence, transposition_table_ai1, MOVE_TIME
             )
             # Callback: se não encontrar movimento válido, faz um aleatório.
             if not best_move:
@@ -111,7 +117,7 @@ def ai_vs_ai(
             board.push(best_move)
         else:
             best_move = get_best_move(
-                board, depth_black, sequence, transposition_table_ai2
+                board, depth_black, sequence, transposition_table_ai2, MOVE_TIME
             )
             # Callback: se não encontrar movimento válido, faz um aleatório.
             if not best_move:
@@ -212,18 +218,8 @@ results = {
 }
 
 # Inicializar tabelas de transposição
-transposition_tables = {
-    1: {},
-    2: {},
-    3: {},
-    4: {},
-    5: {},
-    6: {},
-    7: {},
-    8: {},
-    9: {},
-    10: {},
-}
+# Cada IA tem a sua tabela, com tamanho fixo em MB
+transposition_tables = {depth: TranspositionTable(HASH_MB) for depth in range(1, 11)}
 
 # Inicializar contador de jogos
 game_number = 1
@@ -0,0 +1,148 @@
+from array import array
+from typing import Optional, Tuple
+
+import chess
+
+# Bound type of a stored score
+EXACT = 1
+LOWER = 2  # fail-high: real score >= stored score
+UPPER = 3  # fail-low: real score <= stored score
+
+# Scores above this are mates, they are stored relative to the node instead of the root
+MATE_THRESHOLD = 90000.0
+
+# key check (4) + depth (1) + score (4) + flag (1) + move (2) + age (1)
+ENTRY_BYTES = 13
+BUCKET_SIZE = 2  # slot 0 keeps the deepest entry, slot 1 is always replaced
+
+
+# Pack a move in 16 bits: from (6) | to (6) | promotion piece type (4). The
+# search stores, compares and indexes moves in this form and only turns them
+# back into chess.Move to play them on the board; 0 (a1a1) is no move
+def encode_move(move: Optional[chess.Move]) -> int:
+    if move is None:
+        return 0
+    return move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)
+
+
+def decode_move(packed: int) -> Optional[chess.Move]:
+    if packed == 0:
+        return None
+    return chess.Move(packed & 63, (packed >> 6) & 63, (packed >> 12) or None)
+
+
+# Mate scores are counted from the root, but the same position can be reached at any ply
+def score_to_tt(score: float, ply: int) -> float:
+    if score >= MATE_THRESHOLD:
+        return score + ply
+    if score <= -MATE_THRESHOLD:
+        return score - ply
+    return score
+
+
+def score_from_tt(score: float, ply: int) -> float:
+    if score >= MATE_THRESHOLD:
+        return score - ply
+    if score <= -MATE_THRESHOLD:
+        return score + ply
+    return score
+
+
+class TranspositionTable:
+    def __init__(self, size_mb: float = 16):
+        # Number of buckets is a power of two so the index is a simple mask
+        buckets = max(1, int(size_mb * 1024 * 1024) // (ENTRY_BYTES * BUCKET_SIZE))
+        self.buckets = 1 << (buckets.bit_length() - 1)
+        self.mask = self.buckets - 1
+        self.size = self.buckets * BUCKET_SIZE
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+        self.clear()
+
+    def clear(self) -> None:
+        self.keys = array("I", bytes(4 * self.size))
+        self.depths = array("b", bytes(self.size))
+        self.scores = array("f", bytes(4 * self.size))
+        self.flags = array("B", bytes(self.size))
+        self.moves = array("H", bytes(2 * self.size))
+        self.ages = array("B", bytes(self.size))
+
+    # Called once per search so old entries can be told apart and replaced first
+    def new_search(self) -> None:
+        self.age = (self.age + 1) & 255
+        self.probes = 0
+        self.hits = 0
+
+    def _find(self, key: int) -> int:
+        index = (key & self.mask) * BUCKET_SIZE
+        check = key >> 32
+        for slot in range(index, index + BUCKET_SIZE):
+            if self.flags[slot] and self.keys[slot] == check:
+                return slot
+        return -1
+
+    # Returns a score usable for a cutoff (or None) and the stored best move,
+    # packed (0 when there is none)
+    def probe(
+        self, key: int, depth: int, alpha: float, beta: float, ply: int = 0
+    ) -> Tuple[Optional[float], int]:
+        self.probes += 1
+        slot = self._find(key)
+        if slot < 0:
+            return None, 0
+        self.hits += 1
+        move = self.moves[slot]
+        if self.depths[slot] < depth:
+            return None, move
+
+        score = score_from_tt(self.scores[slot], ply)
+        flag = self.flags[slot]
+        if (
+            flag == EXACT
+            or (flag == LOWER and score >= beta)
+            or (flag == UPPER and score <= alpha)
+        ):
+            return score, move
+        return None, move
+
+    def store(
+        self,
+        key: int,
+        depth: int,
+        score: float,
+        flag: int,
+        move: int,
+        ply: int = 0,
+    ) -> None:
+        index = (key & self.mask) * BUCKET_SIZE
+        check = key >> 32
+        slot = self._find(key)
+        if slot < 0:
+            # Depth-preferred slot, unless it holds something deeper from this search
+            slot = index
+            if (
+                self.flags[slot]
+                and self.ages[slot] == self.age
+                and self.depths[slot] > depth
+            ):
+                slot = index + 1
+        elif not move:
+            # Keep the best move we already know for this position
+            move = self.moves[slot]
+
+        self.keys[slot] = check
+        self.depths[slot] = min(depth, 127)
+        self.scores[slot] = score_to_tt(score, ply)
+        self.flags[slot] = flag
+        self.moves[slot] = move
+        self.ages[slot] = self.age
+
+    # Permille of the sampled slots used in the current search
+    def hashfull(self) -> int:
+        sample = min(1000, self.size)
+        return (
+            sum(1 for i in range(sample) if self.flags[i] and self.ages[i] == self.age)
+            * 1000
+            // sample
+        )
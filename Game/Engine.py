@@ -4,8 +4,11 @@ from typing import Dict, List, Optional, Tuple
 import chess
 from Openings import openings
 from Tables import manhattan_center_distance_king
+from TimeControl import SearchTimeout, TimeControl
 
 MATE_SCORE = 100000.0
+# Largura da janela nula usada para testar os lances depois do primeiro
+NULL_WINDOW = 0.01
 
 PIECE_VALUES = {
     chess.PAWN: 1,
@@ -17,10 +20,18 @@ PIECE_VALUES = {
 
 
 class ChessEngine:
-    def __init__(self, board: chess.Board, depth: int, color: chess.Color):
+    def __init__(
+        self,
+        board: chess.Board,
+        depth: int,
+        color: chess.Color,
+        movetime: Optional[float] = None,
+    ):
         self.board = board
-        self.depth = depth
+        self.depth = depth  # profundidade máxima do iterative deepening
         self.color = color  # chess.WHITE or chess.BLACK
+        self.time_control = TimeControl(movetime)
+        self.root_ply = 0
 
     def select_random_opening(self, ope: Dict[str, List[str]]) -> Optional[Tuple[str, List[str]]]:
         if not ope:
@@ -80,10 +91,16 @@ class ChessEngine:
         return score
 
     def move_ordering(self, moves: List[chess.Move]):
-        return moves.sort(key=self.move_score, reverse=True)
+        return sorted(moves, key=self.move_score, reverse=True)
+
+    # Avaliação do ponto de vista de quem joga (necessário para o negamax)
+    def evaluate_relative(self) -> float:
+        score = self.evaluate_board()
+        return score if self.board.turn == chess.WHITE else -score
 
     def quiescence(self, alpha, beta):
-        eval = self.evaluate_board()
+        self.time_control.check()
+        eval = self.evaluate_relative()
         if eval >= beta:
             return beta
         alpha = max(alpha, eval)
@@ -102,30 +119,85 @@ class ChessEngine:
         return alpha
 
     def minimax(self, depth: int, alpha: float, beta: float) -> float:
+        self.time_control.check()
         moves = list(self.board.legal_moves)
         if len(moves) == 0:
-            start_depth = self.depth
+            ply = len(self.board.move_stack) - self.root_ply
             if self.board.is_check():
                 # Cheque-Mate
-                return start_depth - depth - MATE_SCORE
+                return ply - MATE_SCORE
             else:
                 # Empate
-                return start_depth - depth
+                return 0.0
 
         if depth == 0:
-            score = self.evaluate_board()
+            score = self.evaluate_relative()
             return score
 
+        # PVS: o primeiro lance usa a janela completa, os outros uma janela nula,
+        # e só são refeitos com a janela completa se passarem de alpha
         moves = self.move_ordering(moves)
-        for move in moves:
+        for i, move in enumerate(moves):
             self.board.push(move)
-            eval_score = -self.minimax(depth - 1, -beta, -alpha)
+            if i == 0:
+                eval_score = -self.minimax(depth - 1, -beta, -alpha)
+            else:
+                eval_score = -self.minimax(depth - 1, -alpha - NULL_WINDOW, -alpha)
+                if alpha < eval_score < beta:
+                    eval_score = -self.minimax(depth - 1, -beta, -alpha)
             self.board.pop()
             if eval_score >= beta:
                 return beta
             alpha = max(alpha, eval_score)
         return alpha
 
+    def search_root(
+        self, depth: int, pv_move: Optional[chess.Move]
+    ) -> Tuple[Optional[chess.Move], float]:
+        moves = self.move_ordering(list(self.board.legal_moves))
+        # O melhor lance da iteração anterior é buscado primeiro
+        if pv_move in moves:
+            moves.remove(pv_move)
+            moves.insert(0, pv_move)
+
+        best_move: Optional[chess.Move] = None
+        alpha = -MATE_SCORE
+        for i, move in enumerate(moves):
+            self.board.push(move)
+            if i == 0:
+                score = -self.minimax(depth - 1, -MATE_SCORE, -alpha)
+            else:
+                score = -self.minimax(depth - 1, -alpha - NULL_WINDOW, -alpha)
+                if score > alpha:
+                    score = -self.minimax(depth - 1, -MATE_SCORE, -alpha)
+            self.board.pop()
+            if best_move is None or score > alpha:
+                alpha = score
+                best_move = move
+        return best_move, alpha
+
+    def iterative_deepening(self) -> Tuple[Optional[chess.Move], float]:
+        self.time_control.start()
+        self.root_ply = len(self.board.move_stack)
+        best_move: Optional[chess.Move] = None
+        best_score = 0.0
+
+        for depth in range(1, self.depth + 1):
+            try:
+                move, score = self.search_root(depth, best_move)
+            except SearchTimeout:
+                # Desfaz os lances da iteração interrompida
+                while len(self.board.move_stack) > self.root_ply:
+                    self.board.pop()
+                break
+            best_move, best_score = move, score
+            # Mate encontrado, buscar mais fundo não muda o lance
+            if abs(best_score) >= MATE_SCORE - depth:
+                break
+            if not self.time_control.can_start_iteration():
+                break
+        return best_move, best_score
+
     def get_best_move(self, sequence: List[str]) -> chess.Move:
         # Tenta abrir com abertura se houver sequência ou posição inicial
         if sequence or self.board.fen() == chess.STARTING_FEN:
@@ -135,26 +207,7 @@ class ChessEngine:
                 san_move = opening[1][len(sequence)]
                 return chess.Move.from_uci(self.board.parse_san(san=san_move).uci())
 
-        best_move: Optional[chess.Move] = None
-        # Se engine joga White, queremos maximizar; se joga Black, queremos minimizar
-        if self.color == chess.WHITE:
-            best_score = -MATE_SCORE
-        else:
-            best_score = MATE_SCORE
-
-        moves = list(self.board.legal_moves)
-        for move in moves:
-            self.board.push(move)
-            score = self.minimax(self.depth - 1)
-            self.board.pop()
-            if self.color == chess.WHITE:
-                if score >= best_score:
-                    best_score = score
-                    best_move = move
-            else:
-                if score <= best_score:
-                    best_score = score
-                    best_move = move
+        best_move, _ = self.iterative_deepening()
         if best_move:
             return best_move
-        return random.choice(moves)
+        return random.choice(list(self.board.legal_moves))
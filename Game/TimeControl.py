@@ -0,0 +1,58 @@
+import time
+from typing import Optional
+
+# How many nodes are searched between two reads of the clock
+CHECK_INTERVAL = 512
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class TimeControl:
+    def __init__(
+        self,
+        movetime: Optional[float] = None,
+        clock: Optional[float] = None,
+        increment: float = 0.0,
+        moves_to_go: int = 30,
+    ):
+        self.movetime = movetime
+        self.clock = clock
+        self.increment = increment
+        self.moves_to_go = moves_to_go
+        self.budget: Optional[float] = None
+        self.start_time = 0.0
+        self.nodes = 0
+
+    # Time (in seconds) we are allowed to spend on this move, None means no limit
+    def allocate(self) -> Optional[float]:
+        if self.movetime is not None:
+            return self.movetime
+        if self.clock is not None:
+            # Keep a small reserve so we never flag on the last moves
+            share = self.clock / max(1, self.moves_to_go) + 0.8 * self.increment
+            return max(0.01, min(share, self.clock * 0.5))
+        return None
+
+    def start(self) -> None:
+        self.budget = self.allocate()
+        self.start_time = time.perf_counter()
+        self.nodes = 0
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start_time
+
+    def out_of_time(self) -> bool:
+        return self.budget is not None and self.elapsed() >= self.budget
+
+    # The next iteration usually takes several times longer than the last one,
+    # so only start it if at least half of the budget is still available
+    def can_start_iteration(self) -> bool:
+        return self.budget is None or self.elapsed() < self.budget * 0.5
+
+    # Called once per node, aborts the running iteration when the budget is gone
+    def check(self) -> None:
+        self.nodes += 1
+        if self.nodes % CHECK_INTERVAL == 0 and self.out_of_time():
+            raise SearchTimeout